@@ -0,0 +1,92 @@
+"""📄 DOCX walker benchmark: eski O(n²) qidiruv va yangi bir martalik o'tish.
+
+    python bench/bench_docx_walker.py --sizes 500 1000 2000
+
+Katta .docx fayllar generatsiya qilinadi (har 50 paragrafda bitta inline
+rasm). Eski usul har bir w:p uchun document.paragraphs ni qidirardi va
+paragraf ichidagi rasmlarni tashlab yuborardi.
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("GROQ_API_KEY", "gsk_bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from docx import Document  # noqa: E402
+from PIL import Image  # noqa: E402
+
+logging.disable(logging.INFO)
+bot.load_conversion_libs()
+
+
+def generate_docx(paragraphs: int, image_every: int = 50) -> bytes:
+    picture = io.BytesIO()
+    Image.new("RGB", (320, 200), (30, 120, 200)).save(picture, "PNG")
+
+    document = Document()
+    for i in range(paragraphs):
+        paragraph = document.add_paragraph(f"{i}-paragraf. Лорем ипсум matn qatori, ")
+        paragraph.add_run("qalin qism").bold = True
+        if i % image_every == 0:
+            picture.seek(0)
+            document.add_picture(picture)
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def old_walk(document) -> tuple:
+    """Asl algoritm: har bir body elementi uchun paragraflarni chiziqli qidirish"""
+    texts = images = 0
+    for element in document.element.body:
+        if element.tag == bot.P_TAG:
+            for p in document.paragraphs:
+                if p._element == element:
+                    if p.text.strip():
+                        texts += 1
+                    break
+        elif element.tag == bot.R_TAG:
+            images += sum(1 for _ in element.iter(bot.BLIP_TAG))
+    return texts, images
+
+
+def new_walk(document) -> tuple:
+    texts = images = 0
+    for block in bot.iter_docx_blocks(document):
+        if block[0] == "text":
+            texts += bool("".join(run.text for run in block[2]).strip())
+        elif block[0] == "image":
+            images += 1
+    return texts, images
+
+
+def timed(func, *args) -> tuple:
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 500, 1000, 2000])
+    args = parser.parse_args()
+
+    print(f"{'paragraf':>9}{'eski, ms':>11}{'yangi, ms':>11}{'tezlanish':>11}{'rasm eski/yangi':>17}{'PDF, ms':>10}")
+    for size in args.sizes:
+        data = generate_docx(size)
+        document = Document(io.BytesIO(data))
+        old_time, (_, old_images) = timed(old_walk, document)
+        new_time, (_, new_images) = timed(new_walk, document)
+        pdf_time, _ = timed(bot.build_word_pdf, data)
+        print(f"{size:>9}{old_time * 1000:>11.0f}{new_time * 1000:>11.0f}{old_time / new_time:>10.0f}x"
+              f"{f'{old_images}/{new_images}':>17}{pdf_time * 1000:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
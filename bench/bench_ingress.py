@@ -0,0 +1,81 @@
+"""🛂 Webhook kirish filtri: tashlab yuboriladigan update'lar qancha arzonlashdi.
+
+    python bench/bench_ingress.py --updates 20000
+
+Har bir holat uchun bitta update'ga ketgan vaqt o'lchanadi:
+    eski yo'l  — json.loads + Update.de_json (har qanday update uchun)
+    filtr      — UpdateFilter.inspect; qabul qilingan xabar uchun + Update.de_json
+                 (ya'ni "yangi matn" qatori filtrning qo'shimcha narxini ko'rsatadi)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("GROQ_API_KEY", "gsk_bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from telegram import Bot, Update  # noqa: E402
+
+
+def message_update(update_id: int, **fields) -> bytes:
+    """Telegram yuboradigan ko'rinishdagi (ixcham) update"""
+    message = {
+        "message_id": update_id,
+        "from": {"id": 42, "is_bot": False, "first_name": "Bench", "language_code": "uz"},
+        "chat": {"id": 42, "first_name": "Bench", "type": "private"},
+        "date": 1700000000,
+        **fields,
+    }
+    return json.dumps({"update_id": update_id, "message": message}, separators=(",", ":")).encode()
+
+
+def per_update_us(function, bodies: list) -> float:
+    started = time.perf_counter()
+    for body in bodies:
+        function(body)
+    return (time.perf_counter() - started) / len(bodies) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=20000)
+    args = parser.parse_args()
+
+    telegram_bot = Bot(bot.BOT_TOKEN)
+    reply = {"message_id": 1, "date": 1700000000, "chat": {"id": 42, "type": "private"}, "text": "oldingi xabar"}
+    cases = {
+        "takroriy": [message_update(7, text="salom", reply_to_message=reply)] * args.updates,
+        "sticker": [message_update(i, sticker={"file_id": "s", "file_unique_id": "s", "type": "regular",
+                                              "width": 512, "height": 512, "is_animated": False,
+                                              "is_video": False}) for i in range(args.updates)],
+        "edited": [json.dumps({"update_id": i, "edited_message": {"message_id": i, "date": 0, "text": "x",
+                                                                 "chat": {"id": 42, "type": "private"}}}).encode()
+                   for i in range(args.updates)],
+        "yangi matn": [message_update(i, text="salom") for i in range(args.updates)],
+    }
+
+    def old_path(body: bytes):
+        Update.de_json(json.loads(body), telegram_bot)
+
+    print(f"{'holat':<12}{'eski, µs':>10}{'filtr, µs':>11}{'tezlanish':>11}")
+    for name, bodies in cases.items():
+        update_filter = bot.UpdateFilter(secret=None)
+        if name == "takroriy":
+            update_filter.accept(json.loads(bodies[0]))
+
+        def new_path(body: bytes):
+            json_data = update_filter.inspect(body)
+            if json_data is not None:
+                Update.de_json(json_data, telegram_bot)
+
+        old = per_update_us(old_path, bodies)
+        new = per_update_us(new_path, bodies)
+        print(f"{name:<12}{old:>10.1f}{new:>11.1f}{old / new:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""🖼 JPEG passthrough va to'liq qayta kodlash yo'lini solishtirish.
+
+    python bench/bench_jpeg_passthrough.py                   # sintetik korpus
+    python bench/bench_jpeg_passthrough.py --corpus ~/photos  # haqiqiy telefon rasmlari
+
+Har bir rasm uchun render_image ikki rejimda o'lchanadi (passthrough
+yoqilgan/o'chirilgan), so'ng tayyor PDF hajmi ham solishtiriladi.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("GROQ_API_KEY", "gsk_bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from fpdf import FPDF  # noqa: E402
+from PIL import Image, ImageFilter  # noqa: E402
+
+
+def synthetic_photo(width: int, height: int, **save_kwargs) -> bytes:
+    """Telefon rasmiga o'xshash (shovqin + gradient) JPEG"""
+    noise = Image.effect_noise((width // 4, height // 4), 60).convert("RGB")
+    img = noise.resize((width, height), Image.Resampling.BICUBIC).filter(ImageFilter.GaussianBlur(2))
+    tint = Image.new("RGB", (width, height), tuple(random.randint(40, 220) for _ in range(3)))
+    img = Image.blend(img, tint, 0.5)
+    output = io.BytesIO()
+    img.save(output, "JPEG", **save_kwargs)
+    return output.getvalue()
+
+
+def synthetic_corpus(count: int) -> list:
+    """Telefon rasmlari aralashmasi: Telegram siqgan (passthrough), katta asl va EXIF bilan burilgan"""
+    random.seed(7)
+    rotated = Image.Exif()
+    rotated[bot.EXIF_ORIENTATION] = 6
+    corpus = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            corpus.append(synthetic_photo(4032, 3024, quality=92))  # asl 12MP fayl: kichraytiriladi
+        elif kind == 1:
+            corpus.append(synthetic_photo(1280, 960, quality=87, exif=rotated.tobytes()))  # burish kerak
+        else:
+            corpus.append(synthetic_photo(1280, 960, quality=87))  # Telegram photo: passthrough
+    return corpus
+
+
+def load_corpus(path: str) -> list:
+    files = sorted(
+        os.path.join(path, name) for name in os.listdir(path)
+        if name.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+    )
+    corpus = []
+    for name in files:
+        with open(name, "rb") as f:
+            corpus.append(f.read())
+    return corpus
+
+
+def build_pdf(rendered: list) -> int:
+    pdf = FPDF(unit="mm", format="A4")
+    for jpeg_bytes, width, height in rendered:
+        x, y, w, h = bot.fit_on_page(width, height)
+        pdf.add_page()
+        pdf.image(io.BytesIO(jpeg_bytes), x=x, y=y, w=w, h=h)
+    return len(pdf.output())
+
+
+def measure(corpus: list, passthrough: bool, repeat: int) -> tuple:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rendered = [bot.render_image(data, passthrough=passthrough) for data in corpus]
+        best = min(best, time.perf_counter() - started)
+    return best, rendered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="rasmlar papkasi (bo'lmasa sintetik korpus)")
+    parser.add_argument("--count", type=int, default=20, help="sintetik rasmlar soni")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.count)
+    eligible = []
+    for data in corpus:
+        with Image.open(io.BytesIO(data)) as img:
+            if bot.is_passthrough_jpeg(img):
+                eligible.append(data)
+    print(f"Korpus: {len(corpus)} ta rasm, {sum(map(len, corpus)) / 1024 / 1024:.1f} MB, passthrough: {len(eligible)} ta")
+
+    full_time, full_rendered = measure(corpus, passthrough=False, repeat=args.repeat)
+    fast_time, fast_rendered = measure(corpus, passthrough=True, repeat=args.repeat)
+
+    print(f"{'rejim':<14}{'render, ms':>12}{'ms/rasm':>10}{'PDF, KB':>10}")
+    for name, elapsed, rendered in (("to'liq", full_time, full_rendered), ("passthrough", fast_time, fast_rendered)):
+        print(f"{name:<14}{elapsed * 1000:>12.0f}{elapsed * 1000 / len(corpus):>10.1f}{build_pdf(rendered) / 1024:>10.0f}")
+    print(f"Tezlanish (butun korpus): {full_time / fast_time:.2f}x")
+
+    if eligible:
+        full_time, _ = measure(eligible, passthrough=False, repeat=args.repeat)
+        fast_time, _ = measure(eligible, passthrough=True, repeat=args.repeat)
+        print(f"Tezlanish (faqat mos JPEG'lar): {full_time / fast_time:.0f}x "
+              f"({full_time * 1000 / len(eligible):.1f} -> {fast_time * 1000 / len(eligible):.2f} ms/rasm)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""🚀 Sovuq start: import vaqti va birinchi update'gacha vaqt.
+
+    python bench/bench_startup.py                          # 3 marta, medianalar
+    python bench/bench_startup.py --runs 5 --env CONVERT_WARMUP=0
+    python bench/bench_startup.py --record startup.jsonl   # natijani tarixga qo'shish
+
+O'lchovlar (har biri yangi jarayonda):
+    import        — `python -X importtime -c "import bot"`: bot moduli va eng og'ir importlar
+    eager import  — import + load_conversion_libs() (eski, hammasi startda yuklanadigan holat)
+    ready         — bot.py ishga tushganidan webhook birinchi update'ni qabul qilguncha
+    first reply   — o'sha paytdan /start javobi kelguncha
+    first PDF     — birinchi "✅ Create PDF" dan sendDocument gacha (warm-up ta'siri shu yerda)
+Telegram va Groq o'rniga lokal serverlar ishlaydi (fake_telegram.py, fake_groq.py).
+--record bilan natija JSON qator bo'lib faylga qo'shiladi va oldingisi bilan solishtiriladi.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_groq  # noqa: E402
+import fake_telegram  # noqa: E402
+import replay  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def import_profile() -> tuple:
+    """(bot importi, ms; [(modul, ms), ...] bot'ning to'g'ridan-to'g'ri og'ir importlari)"""
+    env = dict(os.environ, BOT_TOKEN=replay.TOKEN, GROQ_API_KEY="gsk_bench")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import bot"],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            entries.append((len(match[3]), match[4], int(match[2]) / 1000))
+    # importtime bolalarni ota-modulidan oldin yozadi
+    bot_index = next(i for i, entry in enumerate(entries) if entry[1] == "bot")
+    depth, _, total = entries[bot_index]
+    children = []
+    for level, name, cumulative in reversed(entries[:bot_index]):
+        if level <= depth:
+            break
+        if level == depth + 2:
+            children.append((name, cumulative))
+    return total, sorted(children, key=lambda item: -item[1])
+
+
+def wall_import_ms(code: str) -> float:
+    env = dict(os.environ, BOT_TOKEN=replay.TOKEN, GROQ_API_KEY="gsk_bench")
+    script = f"import time; started = time.perf_counter(); {code}; print((time.perf_counter() - started) * 1000)"
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+async def first_update(args) -> dict:
+    """bot.py ni ishga tushirib ready / first reply / first PDF vaqtlarini o'lchash"""
+    groq_runner = await fake_groq.start_server(port=args.groq_port)
+    telegram_runner, telegram = await fake_telegram.start_server(port=args.telegram_port)
+    replayer = replay.Replayer(args, telegram)
+    user_id = 777
+    result = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        bot = replay.start_bot(args, workdir)
+        try:
+            async with aiohttp.ClientSession() as http:
+                replayer.http = http
+                stats = {"updates": 0, "rejected": 0, "acks": []}
+                reply = telegram.wait_for(user_id, lambda method, params: True)
+                update = replayer.text(user_id, "/start")
+                while True:
+                    if bot.poll() is not None:
+                        raise RuntimeError(f"bot.py to'xtadi (kod {bot.returncode})")
+                    try:
+                        if await replayer.post(update, stats):
+                            break
+                    except aiohttp.ClientError:
+                        pass
+                    await asyncio.sleep(0.01)
+                result["ready_ms"] = (time.perf_counter() - started) * 1000
+                replied_at = (await asyncio.wait_for(reply, args.timeout))[0]
+                result["first_reply_ms"] = (replied_at - started) * 1000
+
+                for update in replayer.session_updates("image", user_id)[1:-1]:
+                    await replayer.post(update, stats)
+                await asyncio.sleep(args.pdf_delay)
+                done = telegram.wait_for(user_id, lambda method, params: replay.Replayer.finished("image", method, params))
+                triggered = time.perf_counter()
+                await replayer.post(replayer.text(user_id, "✅ Create PDF"), stats)
+                finished_at, method, _ = await asyncio.wait_for(done, args.timeout)
+                result["first_pdf_ms"] = (finished_at - triggered) * 1000 if method == "sendDocument" else None
+                await replay.wait_quiet(telegram, quiet=0.5)
+        finally:
+            replay.stop_bot(bot)
+            await telegram_runner.cleanup()
+            await groq_runner.cleanup()
+    return result
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8, help="ko'rsatiladigan og'ir importlar soni")
+    parser.add_argument("--pdf-delay", type=float, default=1.0,
+                        help="start javobidan Create PDF gacha kutish (s), warm-up ulgurishi uchun")
+    parser.add_argument("--font-dir", default=os.getenv("FONT_DIR", "."))
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="bot sozlamasi")
+    parser.add_argument("--record", help="natijani JSONL faylga qo'shish")
+    args = parser.parse_args()
+    replay_args = replay.build_parser().parse_args(
+        ["--font-dir", args.font_dir, "--photos", "1", "--timeout", "60"]
+        + [item for env in args.env for item in ("--env", env)]
+    )
+    replay_args.pdf_delay = args.pdf_delay
+
+    total, children = import_profile()
+    print(f"import bot: {total:.0f} ms (-X importtime); eng og'ir importlar:")
+    for name, cumulative in children[:args.top]:
+        print(f"    {name:<24}{cumulative:>8.0f} ms")
+
+    runs = []
+    for _ in range(args.runs):
+        run = {
+            "import_ms": wall_import_ms("import bot"),
+            "eager_import_ms": wall_import_ms("import bot; bot.load_conversion_libs()"),
+        }
+        run.update(asyncio.run(first_update(replay_args)))
+        runs.append(run)
+
+    summary = {key: round(statistics.median(run[key] for run in runs), 1)
+               for key in runs[0] if all(run[key] is not None for run in runs)}
+    print(f"\n{'o‘lchov':<18}{'mediana, ms':>12}   (har bir urinish)")
+    for key, value in summary.items():
+        print(f"{key:<18}{value:>12}   {', '.join(f'{run[key]:.0f}' for run in runs)}")
+
+    if args.record:
+        previous = None
+        if os.path.exists(args.record):
+            with open(args.record, encoding="utf-8") as f:
+                lines = [line for line in f if line.strip()]
+            previous = json.loads(lines[-1]) if lines else None
+        record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": current_commit(),
+                  "env": args.env, **summary}
+        with open(args.record, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if previous:
+            print(f"\nOldingi yozuv ({previous.get('commit') or previous['time']}) bilan farq:")
+            for key, value in summary.items():
+                if isinstance(previous.get(key), (int, float)):
+                    print(f"    {key:<18}{value - previous[key]:>+10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
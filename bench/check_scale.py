@@ -0,0 +1,66 @@
+"""🧩 Ko'p jarayonli rejim: update/s worker jarayonlari soni bilan chiziqli o'sadimi.
+
+    python bench/check_scale.py                                 # 1, 2, 4 worker; word oqimi
+    python bench/check_scale.py --workers 1 2 4 8 --flow chat --sessions 400
+    python bench/check_scale.py --min-efficiency 0.7 --env CONVERT_WORKERS=2
+
+Har bir N uchun bench/replay.py bot.py ni WORKER_PROCESSES=N bilan ishga
+tushiradi va yuklamani cheklovsiz tezlikda beradi. Samaradorlik =
+update/s(N) / (update/s(1-qator) × N). CPU yadrolari N dan kam bo'lsa,
+o'sha qator faqat ma'lumot uchun chiqadi va tekshirilmaydi.
+Chegaradan past bo'lsa skript 1 kod bilan chiqadi.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import replay  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--flow", choices=("chat", "image", "word"), default="word")
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--min-efficiency", type=float, default=0.7)
+    parser.add_argument("--font-dir", default=os.getenv("FONT_DIR", "."))
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="bot sozlamasi")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    print(f"Oqim: {args.flow}, {args.sessions} sessiya, CPU yadrolari: {cores}")
+    print(f"{'worker':>7}{'ok':>5}{'upd/s':>9}{'p95 ms':>10}{'tezlanish':>11}{'samara':>8}")
+
+    base = None
+    failed = False
+    for count in args.workers:
+        argv = ["--flows", args.flow, "--sessions", str(args.sessions), "--rate", "0",
+                "--concurrency", str(args.concurrency), "--font-dir", args.font_dir,
+                "--env", f"WORKER_PROCESSES={count}"]
+        for item in args.env:
+            argv += ["--env", item]
+        stats = asyncio.run(replay.run(replay.build_parser().parse_args(argv)))[args.flow]
+
+        if base is None:
+            base = (count, stats["updates_per_sec"])
+        speedup = stats["updates_per_sec"] / base[1] if base[1] else 0.0
+        efficiency = speedup / (count / base[0])
+        checked = count <= cores
+        bad = stats["ok"] < stats["sessions"] or (checked and efficiency < args.min_efficiency)
+        failed |= bad
+        mark = "  ❌" if bad else ("  ✅" if checked else "  (yadro yetmaydi)")
+        print(f"{count:>7}{stats['ok']:>5}{stats['updates_per_sec']:>9}{str(stats['p95_ms']):>10}"
+              f"{speedup:>10.2f}x{efficiency:>8.2f}{mark}")
+
+    if failed:
+        print("❌ Chiziqli o'sish chegarasidan past")
+        sys.exit(1)
+    print("✅ Ko'p jarayonli rejim chegarada")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""🌊 Oqimli rejim xotira tekshiruvi: katta kirishlarda eng yuqori RSS chegaradan oshmasin.
+
+    python bench/check_stream_memory.py                      # 150 rasm + katta DOCX
+    python bench/check_stream_memory.py --max-rss-mb 128 --compare
+
+Har bir holat alohida jarayonda ishlaydi (ru_maxrss toza bo'lishi uchun).
+Sintetik kirishlar diskda yaratiladi, konvertatsiya esa oqimli funksiyalar
+(write_image_pdf_streaming, build_word_pdf_streaming) orqali. --compare
+bilan eski xotiradagi yo'l ham o'lchanadi (faqat ma'lumot uchun).
+Chegaradan oshsa skript 1 kod bilan chiqadi.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("GROQ_API_KEY", "gsk_bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from docx import Document  # noqa: E402
+from fpdf import FPDF  # noqa: E402
+from PIL import Image  # noqa: E402
+
+logging.disable(logging.INFO)
+
+
+def peak_mb() -> float:
+    """Jarayonning eng yuqori RSS i (MB).
+
+    Linux'da ru_maxrss exec'dan keyin ota jarayon qiymatini saqlab qoladi,
+    shuning uchun iloji bo'lsa /proc dagi VmHWM ishlatiladi.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def noisy_jpeg(width: int, height: int, quality: int = 90) -> bytes:
+    """Yomon siqiladigan (katta) JPEG"""
+    output = io.BytesIO()
+    Image.effect_noise((width, height), 60).convert("RGB").save(output, "JPEG", quality=quality)
+    return output.getvalue()
+
+
+def generate_images(directory: str, count: int, width: int, height: int) -> list:
+    """Bir nechta turli rasm, count ta faylga nusxalanadi"""
+    variants = [noisy_jpeg(width, height) for _ in range(min(count, 8))]
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"image{i}.jpg")
+        with open(path, "wb") as f:
+            f.write(variants[i % len(variants)])
+        paths.append(path)
+    return paths
+
+
+def generate_docx(path: str, paragraphs: int, images: int):
+    """Har bir rasm alohida (python-docx bir xil rasmlarni bitta qismga birlashtiradi)"""
+    document = Document()
+    every = max(paragraphs // max(images, 1), 1)
+    for i in range(paragraphs):
+        paragraph = document.add_paragraph(f"{i}-paragraf. Лорем ипсум долор сит амет, matn qatori. " * 3)
+        paragraph.add_run("qalin qism").bold = True
+        if images and i % every == 0:
+            document.add_picture(io.BytesIO(noisy_jpeg(1600, 1200)))
+    document.save(path)
+
+
+async def images_in_memory(paths: list):
+    """Eski yo'l: barcha natijalar va FPDF xotirada, so'ng pdf.output()"""
+    loop = asyncio.get_running_loop()
+    executor = bot.get_image_executor()
+    results = await asyncio.gather(*(loop.run_in_executor(executor, bot.render_image, path) for path in paths))
+    pdf = FPDF(unit="mm", format="A4")
+    for jpeg_bytes, width, height in results:
+        x, y, w, h = bot.fit_on_page(width, height)
+        pdf.add_page()
+        pdf.image(io.BytesIO(jpeg_bytes), x=x, y=y, w=w, h=h)
+    return bytes(pdf.output())
+
+
+def run_scenario(name: str, inputs: list) -> dict:
+    """Bola jarayonda: bitta konvertatsiya va RSS o'lchovi"""
+    bot.font_cache.load()
+    baseline = peak_mb()
+    started = time.perf_counter()
+    with tempfile.TemporaryFile() as out:
+        if name == "images-stream":
+            sources = [(path, os.path.getsize(path)) for path in inputs]
+            pages = asyncio.run(bot.write_image_pdf_streaming(sources, out))
+            size = out.tell()
+        elif name == "images-memory":
+            pdf_bytes = asyncio.run(images_in_memory(inputs))
+            pages, size = len(inputs), len(pdf_bytes)
+        elif name == "word-stream":
+            bot.build_word_pdf_streaming(inputs[0], out)
+            pages, size = None, out.tell()
+        elif name == "word-memory":
+            pdf_bytes = bot.build_word_pdf(inputs[0])
+            pages, size = None, len(pdf_bytes)
+    if bot.image_executor is not None:
+        bot.image_executor.shutdown()
+    return {
+        "seconds": round(time.perf_counter() - started, 1),
+        "baseline_mb": round(baseline),
+        "peak_mb": round(peak_mb()),
+        "growth_mb": round(peak_mb() - baseline),
+        "pages": pages,
+        "output_mb": round(size / 1024 / 1024, 1),
+    }
+
+
+def measure(name: str, inputs: list) -> dict:
+    """Holatni yangi jarayonda ishga tushirish"""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--scenario", name, *inputs],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=150)
+    parser.add_argument("--image-size", type=int, nargs=2, default=[1200, 1200], metavar=("W", "H"))
+    parser.add_argument("--paragraphs", type=int, default=6000)
+    parser.add_argument("--docx-images", type=int, default=30)
+    parser.add_argument("--max-rss-mb", type=float, default=96, help="ruxsat etilgan RSS o'sishi (MB)")
+    parser.add_argument("--compare", action="store_true", help="xotiradagi eski yo'lni ham o'lchash")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    parser.add_argument("inputs", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        print(json.dumps(run_scenario(args.scenario, args.inputs)))
+        return
+
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        paths = generate_images(directory, args.images, *args.image_size)
+        docx_path = os.path.join(directory, "large.docx")
+        generate_docx(docx_path, args.paragraphs, args.docx_images)
+        images_mb = sum(os.path.getsize(path) for path in paths) / 1024 / 1024
+        docx_mb = os.path.getsize(docx_path) / 1024 / 1024
+        print(f"Kirish: {len(paths)} ta rasm ({images_mb:.0f}MB), DOCX {docx_mb:.0f}MB; chegara +{args.max_rss_mb:.0f}MB")
+
+        scenarios = [("images-stream", paths), ("word-stream", [docx_path])]
+        if args.compare:
+            scenarios += [("images-memory", paths), ("word-memory", [docx_path])]
+
+        print(f"{'holat':<15}{'vaqt, s':>9}{'PDF, MB':>9}{'RSS, MB':>9}{'o‘sish':>9}")
+        for name, inputs in scenarios:
+            stats = measure(name, inputs)
+            checked = name.endswith("-stream")
+            over = checked and stats["growth_mb"] > args.max_rss_mb
+            failed |= over
+            mark = "  ❌" if over else ("  ✅" if checked else "")
+            print(f"{name:<15}{stats['seconds']:>9}{stats['output_mb']:>9}{stats['peak_mb']:>9}"
+                  f"{stats['growth_mb']:>9}{mark}")
+
+    if failed:
+        print("❌ Oqimli rejim xotira chegarasidan oshdi")
+        sys.exit(1)
+    print("✅ Oqimli rejim xotira chegarasida")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""✏️ Streaming javobni lokal stub SSE serverga qarshi tekshirish.
+
+    python bench/check_streaming.py
+
+Birinchi token vaqti (TTFT), to'liq javob vaqti va placeholder
+tahrirlari soni chiqariladi; streaming ishlamasa xatolik bilan tugaydi.
+"""
+import asyncio
+import os
+import sys
+import time
+
+PORT = 8766
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("GROQ_API_KEY", "gsk_bench")
+os.environ["GROQ_API_URL"] = f"http://127.0.0.1:{PORT}/openai/v1/chat/completions"
+os.environ["STREAM_EDIT_INTERVAL"] = "0.1"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from fake_groq import REPLY_TEXT, start_server  # noqa: E402
+
+
+class FakeMessage:
+    """Telegram Message o'rniga: tahrirlarni yozib boradi"""
+
+    def __init__(self):
+        self.edits = []
+
+    async def edit_text(self, text):
+        self.edits.append((time.monotonic(), text))
+
+    async def reply_text(self, text):
+        self.edits.append((time.monotonic(), text))
+
+
+async def main():
+    runner = await start_server(port=PORT, latency=0.2, token_delay=0.05)
+    try:
+        message = FakeMessage()
+        editor = bot.StreamingEditor(message)
+        started = time.monotonic()
+        reply = await bot.chatbot_reply("salom", user_id=1, on_delta=editor.update)
+        await editor.finish(reply)
+        total = time.monotonic() - started
+    finally:
+        await bot.groq_client.aclose()
+        await runner.cleanup()
+
+    assert reply.strip() == REPLY_TEXT, reply
+    assert len(message.edits) > 2, f"progressiv tahrir yo'q: {len(message.edits)}"
+    assert message.edits[-1][1] == reply, "yakuniy tahrir to'liq javob emas"
+
+    ttft = message.edits[0][0] - started
+    print(f"TTFT: {ttft * 1000:.0f} ms, to'liq javob: {total * 1000:.0f} ms, tahrirlar: {len(message.edits)}")
+    print("✅ Streaming ishlayapti")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""🤖 Lokal Groq (chat completions) o'rinbosari.
+
+Oddiy JSON javob va `stream: true` (SSE) rejimini qo'llaydi.
+
+    python bench/fake_groq.py --port 8765 --latency 0.3 --jitter 0.2 --token-delay 0.05
+
+Bot bilan: GROQ_API_URL=http://127.0.0.1:8765/openai/v1/chat/completions
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+REPLY_TEXT = "Salom! 😊 Men lokal test serveriman. Savolingizni qisqa va tushunarli javob beraman."
+
+
+def create_app(latency: float = 0.0, token_delay: float = 0.02, reply_text: str = REPLY_TEXT,
+               jitter: float = 0.0) -> web.Application:
+    """Stub server ilovasi; `app["stats"]` da so'rovlar soni"""
+    stats = {"requests": 0, "streams": 0}
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        stats["requests"] += 1
+        await asyncio.sleep(latency + random.uniform(0, jitter))
+
+        if not payload.get("stream"):
+            return web.json_response({
+                "id": f"chatcmpl-{stats['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply_text},
+                             "finish_reason": "stop"}],
+            })
+
+        stats["streams"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        for token in reply_text.split(" "):
+            chunk = {"choices": [{"index": 0, "delta": {"content": token + " "}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(token_delay)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_post("/openai/v1/chat/completions", completions)
+    return app
+
+
+async def start_server(host: str = "127.0.0.1", port: int = 8765, **kwargs) -> web.AppRunner:
+    """Serverni joriy event loop'da ishga tushirish"""
+    runner = web.AppRunner(create_app(**kwargs))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="birinchi baytgacha kechikish (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="kechikishga qo'shiladigan tasodifiy 0..N s")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="SSE tokenlar orasidagi kechikish (s)")
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency, args.token_delay, jitter=args.jitter), host=args.host, port=args.port)
@@ -0,0 +1,129 @@
+"""📮 Lokal Telegram Bot API o'rinbosari.
+
+Bot ishlatadigan metodlar: getMe, getFile (+ fayl yuklash), sendMessage,
+sendDocument, editMessageText, sendChatAction va webhook metodlari.
+Bot yuborgan har bir xabar `events` ga yoziladi; `wait_for()` bilan
+biror chatdagi kerakli xabarni kutish mumkin (bench/replay.py shunday o'lchaydi).
+
+    python bench/fake_telegram.py --port 8081
+
+Bot bilan: TELEGRAM_API_URL=http://127.0.0.1:8081
+"""
+import argparse
+import asyncio
+import time
+
+from aiohttp import web
+
+SEND_METHODS = ("sendMessage", "sendDocument", "editMessageText")
+
+
+class FakeTelegram:
+    """Bot API holati: fayllar, yuborilgan xabarlar va kutuvchilar"""
+
+    def __init__(self):
+        self.files = {}  # file_id -> bayt
+        self.events = []  # (vaqt, chat_id, metod, parametrlar)
+        self.calls = {}  # metod -> soni
+        self._message_id = 0
+        self._waiters = {}  # chat_id -> [(predicate, Future)]
+
+    def add_file(self, file_id: str, data: bytes):
+        self.files[file_id] = data
+
+    def wait_for(self, chat_id: int, predicate) -> asyncio.Future:
+        """predicate(metod, parametrlar) rost bo'lgan birinchi xabarni kutish.
+
+        Future natijasi: (vaqt, metod, parametrlar).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append((predicate, future))
+        return future
+
+    def _record(self, chat_id: int, method: str, params: dict):
+        now = time.perf_counter()
+        self.events.append((now, chat_id, method, params))
+        waiters = self._waiters.get(chat_id)
+        if not waiters:
+            return
+        for waiter in list(waiters):
+            predicate, future = waiter
+            if future.done():
+                waiters.remove(waiter)
+            elif predicate(method, params):
+                future.set_result((now, method, params))
+                waiters.remove(waiter)
+        if not waiters:
+            del self._waiters[chat_id]
+
+    def _message(self, chat_id: int, params: dict) -> dict:
+        if "message_id" in params:
+            message_id = int(params["message_id"])
+        else:
+            self._message_id += 1
+            message_id = self._message_id
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+    async def api(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {}
+            for key, value in (await request.post()).items():
+                params[key] = value if isinstance(value, str) else len(value.file.read())
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method == "getFile":
+            file_id = params["file_id"]
+            if file_id not in self.files:
+                return web.json_response({"ok": False, "error_code": 400,
+                                          "description": "Bad Request: invalid file_id"}, status=400)
+            result = {"file_id": file_id, "file_unique_id": file_id,
+                      "file_size": len(self.files[file_id]), "file_path": f"files/{file_id}"}
+        elif method in SEND_METHODS:
+            chat_id = int(params.get("chat_id", 0))
+            self._record(chat_id, method, params)
+            result = self._message(chat_id, params)
+        elif method == "getWebhookInfo":
+            result = {"url": "", "has_custom_certificate": False, "pending_update_count": 0}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def download(self, request: web.Request) -> web.Response:
+        data = self.files.get(request.match_info["file_id"])
+        if data is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=data)
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=512 * 1024 * 1024)
+        app["telegram"] = self
+        app.router.add_post("/bot{token}/{method}", self.api)
+        app.router.add_get("/file/bot{token}/files/{file_id}", self.download)
+        return app
+
+
+async def start_server(host: str = "127.0.0.1", port: int = 8081, telegram: FakeTelegram = None):
+    """Serverni joriy event loop'da ishga tushirish; (runner, FakeTelegram) qaytaradi"""
+    telegram = telegram or FakeTelegram()
+    runner = web.AppRunner(telegram.create_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner, telegram
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    web.run_app(FakeTelegram().create_app(), host=args.host, port=args.port)
@@ -0,0 +1,368 @@
+"""⏱ Yuklama benchmark: webhook'ga sintetik update'lar va uchdan-uchgacha kechikish.
+
+    python bench/replay.py                                       # chat, image, word
+    python bench/replay.py --flows chat --sessions 200 --rate 100 --groq-latency 0.3
+    python bench/replay.py --env CONVERT_WORKERS=4 --json natija.json
+    python bench/replay.py --baseline natija.json --tolerance 0.25
+
+Bot alohida jarayonda haqiqiy webhook rejimida ishga tushadi (python bot.py).
+Telegram va Groq o'rniga lokal serverlar ishlaydi (fake_telegram.py,
+fake_groq.py). Har bir sessiya alohida foydalanuvchi:
+    chat:  /start, savol                      -> yakuniy javob matni
+    image: /start, menyu, N ta rasm, Create   -> sendDocument
+    word:  /start, menyu, .docx, Create       -> sendDocument
+Update'lar umumiy --rate (update/s) tezligida yuboriladi. Kechikish oxirgi
+update POST qilingandan botning yakuniy xabarigacha o'lchanadi.
+--baseline bilan p95 yoki update/s tolerance'dan ko'proq yomonlashsa
+skript 1 kod bilan chiqadi.
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_groq  # noqa: E402
+import fake_telegram  # noqa: E402
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot.py")
+TOKEN = "123456:bench"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+FAILURE_PREFIXES = ("❌", "⚠️", "⏳ Oldingi ishingiz")
+
+
+def percentile(values: list, q: float):
+    """Eng yaqin rang usuli bilan q-persentil"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))]
+
+
+def make_jpeg(width: int, height: int) -> bytes:
+    from PIL import Image
+
+    output = io.BytesIO()
+    Image.effect_noise((width, height), 40).convert("RGB").save(output, "JPEG", quality=85)
+    return output.getvalue()
+
+
+def make_docx(paragraphs: int, image: bytes) -> bytes:
+    from docx import Document
+
+    document = Document()
+    document.add_heading("Benchmark hujjati", 1)
+    for i in range(paragraphs):
+        paragraph = document.add_paragraph(f"{i}-paragraf. Лорем ипсум долор сит амет, matn qatori. ")
+        paragraph.add_run("qalin qism").bold = True
+    document.add_picture(io.BytesIO(image))
+    table = document.add_table(rows=3, cols=3)
+    table.cell(0, 0).text = "jadval"
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+class Pacer:
+    """Update'larni umumiy tezlikda tarqatish (rate <= 0 — cheklovsiz)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self.next_at = 0.0
+
+    async def wait(self):
+        now = time.perf_counter()
+        at = max(now, self.next_at)
+        self.next_at = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+
+class Replayer:
+    """Sintetik update'lar yasash, yuborish va natijalarni yig'ish"""
+
+    def __init__(self, args, telegram: fake_telegram.FakeTelegram):
+        self.args = args
+        self.telegram = telegram
+        self.webhook_url = f"http://127.0.0.1:{args.port}/{TOKEN}"
+        secret = dict(item.partition("=")[::2] for item in args.env).get("WEBHOOK_SECRET")
+        self.headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+        self.pacer = Pacer(args.rate)
+        self.jpeg = make_jpeg(*args.image_size)
+        self.docx = make_docx(args.paragraphs, make_jpeg(640, 480))
+        self._update_id = 0
+        self.http = None
+
+    # 🧾 Update yasash
+    def _update(self, user_id: int, **fields) -> dict:
+        self._update_id += 1
+        message = {
+            "message_id": self._update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"bench{user_id}"},
+            **fields,
+        }
+        return {"update_id": self._update_id, "message": message}
+
+    def text(self, user_id: int, text: str) -> dict:
+        if text.startswith("/"):
+            return self._update(user_id, text=text,
+                                entities=[{"type": "bot_command", "offset": 0, "length": len(text)}])
+        return self._update(user_id, text=text)
+
+    def photo(self, user_id: int, index: int) -> dict:
+        file_id = f"photo-{user_id}-{index}"
+        self.telegram.add_file(file_id, self.jpeg)
+        width, height = self.args.image_size
+        return self._update(user_id, photo=[{"file_id": file_id, "file_unique_id": file_id,
+                                             "width": width, "height": height, "file_size": len(self.jpeg)}])
+
+    def document(self, user_id: int) -> dict:
+        file_id = f"docx-{user_id}"
+        self.telegram.add_file(file_id, self.docx)
+        return self._update(user_id, document={"file_id": file_id, "file_unique_id": file_id,
+                                               "file_name": "bench.docx", "mime_type": DOCX_MIME,
+                                               "file_size": len(self.docx)})
+
+    def session_updates(self, flow: str, user_id: int) -> list:
+        updates = [self.text(user_id, "/start")]
+        if flow == "chat":
+            updates.append(self.text(user_id, f"Salom, bu {user_id}-savol. Qandaysan?"))
+        elif flow == "image":
+            updates.append(self.text(user_id, "🖼 Image → PDF"))
+            updates += [self.photo(user_id, i) for i in range(self.args.photos)]
+            updates.append(self.text(user_id, "✅ Create PDF"))
+        elif flow == "word":
+            updates.append(self.text(user_id, "📄 Word → PDF"))
+            updates.append(self.document(user_id))
+            updates.append(self.text(user_id, "✅ Create PDF"))
+        return updates
+
+    # ✅ Yakuniy xabarni aniqlash
+    @staticmethod
+    def finished(flow: str, method: str, params: dict) -> bool:
+        text = str(params.get("text", ""))
+        if text.startswith(FAILURE_PREFIXES):
+            return True
+        if flow == "chat":
+            return text.startswith(fake_groq.REPLY_TEXT[:20]) and not text.endswith("▌")
+        return method == "sendDocument"
+
+    # 📤 Yuborish
+    async def post(self, update: dict, stats: dict) -> bool:
+        await self.pacer.wait()
+        started = time.perf_counter()
+        async with self.http.post(self.webhook_url, json=update, headers=self.headers) as response:
+            await response.read()
+            stats["acks"].append(time.perf_counter() - started)
+            stats["updates"] += 1
+            if response.status != 200:
+                stats["rejected"] += 1
+                return False
+        return True
+
+    async def session(self, flow: str, user_id: int, stats: dict, limit: asyncio.Semaphore):
+        async with limit:
+            updates = self.session_updates(flow, user_id)
+            for update in updates[:-1]:
+                if not await self.post(update, stats):
+                    stats["errors"] += 1
+                    return
+            done = self.telegram.wait_for(user_id, lambda method, params: self.finished(flow, method, params))
+            started = time.perf_counter()
+            if not await self.post(updates[-1], stats):
+                done.cancel()
+                stats["errors"] += 1
+                return
+            try:
+                finished_at, method, params = await asyncio.wait_for(done, self.args.timeout)
+            except asyncio.TimeoutError:
+                stats["timeouts"] += 1
+                return
+            if str(params.get("text", "")).startswith(FAILURE_PREFIXES):
+                stats["errors"] += 1
+                return
+            stats["latencies"].append(finished_at - started)
+            stats["last_done"] = max(stats["last_done"], finished_at)
+
+    async def run_flow(self, flow: str, first_user: int) -> dict:
+        stats = {"updates": 0, "rejected": 0, "errors": 0, "timeouts": 0,
+                 "acks": [], "latencies": [], "last_done": 0.0}
+        limit = asyncio.Semaphore(self.args.concurrency)
+        started = time.perf_counter()
+        await asyncio.gather(*(self.session(flow, first_user + i, stats, limit)
+                               for i in range(self.args.sessions)))
+        elapsed = max(stats["last_done"], time.perf_counter()) - started
+
+        def ms(value):
+            return None if value is None else round(value * 1000, 1)
+
+        return {
+            "sessions": self.args.sessions,
+            "ok": len(stats["latencies"]),
+            "errors": stats["errors"],
+            "timeouts": stats["timeouts"],
+            "rejected": stats["rejected"],
+            "updates": stats["updates"],
+            "seconds": round(elapsed, 2),
+            "updates_per_sec": round(stats["updates"] / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": ms(percentile(stats["latencies"], 50)),
+            "p95_ms": ms(percentile(stats["latencies"], 95)),
+            "p99_ms": ms(percentile(stats["latencies"], 99)),
+            "ack_p99_ms": ms(percentile(stats["acks"], 99)),
+        }
+
+
+# 🤖 Botni alohida jarayonda ishga tushirish
+def start_bot(args, workdir: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        BOT_TOKEN=TOKEN,
+        GROQ_API_KEY="gsk_bench",
+        WEBHOOK_URL=f"http://127.0.0.1:{args.port}",
+        PORT=str(args.port),
+        TELEGRAM_API_URL=f"http://127.0.0.1:{args.telegram_port}",
+        GROQ_API_URL=f"http://127.0.0.1:{args.groq_port}/openai/v1/chat/completions",
+        FONT_DIR=os.path.abspath(args.font_dir),
+        LOG_LEVEL="WARNING",
+    )
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return subprocess.Popen([sys.executable, BOT_PATH], cwd=workdir, env=env)
+
+
+async def wait_ready(http: aiohttp.ClientSession, bot: subprocess.Popen, port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if bot.poll() is not None:
+            raise RuntimeError(f"bot.py ishga tushmadi (kod {bot.returncode})")
+        try:
+            async with http.get(f"http://127.0.0.1:{port}/health") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("bot.py /health javob bermadi")
+
+
+async def wait_quiet(telegram: fake_telegram.FakeTelegram, quiet: float = 1.0, timeout: float = 30):
+    """Bot oxirgi xabarlarini (menyu va h.k.) yuborib bo'lguncha kutish"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not telegram.events or time.perf_counter() - telegram.events[-1][0] >= quiet:
+            return
+        await asyncio.sleep(quiet / 4)
+
+
+def stop_bot(bot: subprocess.Popen):
+    if bot.poll() is None:
+        bot.send_signal(signal.SIGTERM)
+        try:
+            bot.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Baseline'ga nisbatan yomonlashgan ko'rsatkichlar"""
+    regressions = []
+    for flow, current in results.items():
+        before = baseline.get(flow)
+        if not before:
+            continue
+        if before.get("p95_ms") and current["p95_ms"] and current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{flow}: p95 {before['p95_ms']} -> {current['p95_ms']} ms")
+        if before.get("updates_per_sec") and current["updates_per_sec"] < before["updates_per_sec"] * (1 - tolerance):
+            regressions.append(f"{flow}: {before['updates_per_sec']} -> {current['updates_per_sec']} update/s")
+        if current["ok"] < current["sessions"]:
+            regressions.append(f"{flow}: {current['sessions'] - current['ok']} ta sessiya tugamadi")
+    return regressions
+
+
+async def run(args) -> dict:
+    groq_runner = await fake_groq.start_server(port=args.groq_port, latency=args.groq_latency,
+                                               jitter=args.groq_jitter, token_delay=args.token_delay)
+    telegram_runner, telegram = await fake_telegram.start_server(port=args.telegram_port)
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        bot = start_bot(args, workdir)
+        try:
+            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.concurrency)) as http:
+                await wait_ready(http, bot, args.port)
+                replayer = Replayer(args, telegram)
+                replayer.http = http
+                for index, flow in enumerate(args.flows):
+                    results[flow] = await replayer.run_flow(flow, first_user=(index + 1) * 1_000_000)
+                    await wait_quiet(telegram)
+        finally:
+            stop_bot(bot)
+            await telegram_runner.cleanup()
+            await groq_runner.cleanup()
+    return results
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flows", nargs="+", choices=("chat", "image", "word"), default=["chat", "image", "word"])
+    parser.add_argument("--sessions", type=int, default=20, help="har bir oqim uchun foydalanuvchilar soni")
+    parser.add_argument("--rate", type=float, default=50, help="umumiy tezlik, update/s (0 — cheklovsiz)")
+    parser.add_argument("--concurrency", type=int, default=50, help="bir vaqtdagi sessiyalar")
+    parser.add_argument("--timeout", type=float, default=120, help="bitta sessiya uchun kutish (s)")
+    parser.add_argument("--photos", type=int, default=3, help="image sessiyasidagi rasmlar")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[1280, 960], metavar=("W", "H"))
+    parser.add_argument("--paragraphs", type=int, default=200, help="DOCX paragraflari")
+    parser.add_argument("--groq-latency", type=float, default=0.2)
+    parser.add_argument("--groq-jitter", type=float, default=0.1)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--port", type=int, default=18080, help="bot webhook porti")
+    parser.add_argument("--telegram-port", type=int, default=18081)
+    parser.add_argument("--groq-port", type=int, default=18082)
+    parser.add_argument("--font-dir", default=os.getenv("FONT_DIR", "."))
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="bot sozlamasi")
+    parser.add_argument("--json", help="natijani JSON faylga yozish")
+    parser.add_argument("--baseline", help="avvalgi --json natijasi bilan solishtirish")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    results = asyncio.run(run(args))
+
+    print(f"{'oqim':<7}{'sessiya':>8}{'ok':>5}{'xato':>6}{'update':>8}{'upd/s':>8}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ack p99':>9}")
+    for flow, stats in results.items():
+        failed = stats["errors"] + stats["timeouts"]
+        print(f"{flow:<7}{stats['sessions']:>8}{stats['ok']:>5}{failed:>6}{stats['updates']:>8}"
+              f"{stats['updates_per_sec']:>8}{str(stats['p50_ms']):>9}{str(stats['p95_ms']):>9}"
+              f"{str(stats['p99_ms']):>9}{str(stats['ack_p99_ms']):>9}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("❌ Yomonlashish:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("✅ Baseline chegarasida")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,92 +1,820 @@
 import os
 import logging
+import logging.handlers
+import queue
+import atexit
 import io
-import requests
 import asyncio
+import random
+import math
+import json
+import re
+import hmac
+import httpx
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
+from telegram.error import BadRequest, RetryAfter, TelegramError
 from telegram.ext import (
     Application, CommandHandler, MessageHandler,
     ContextTypes, filters
 )
-from fpdf import FPDF
-from PIL import Image
-from docx import Document
-from docx.oxml.ns import qn
 from dotenv import load_dotenv
-from flask import Flask, request
+import aiohttp
+from aiohttp import web
 import shutil
+import signal
+import sys
+import copy
 import threading
-from queue import Queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import time
+import hashlib
+import sqlite3
+from collections import OrderedDict, deque, namedtuple
+from bisect import bisect_left
+import tempfile
+import zipfile
 
 # .env faylni o'qish
 load_dotenv()
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# 📜 Logging: matn yoki JSON, navbat orqali (event loop diskka/stdout ga yozmaydi)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE = os.getenv("LOG_QUEUE", "1") == "1"
+LOG_REDACT = os.getenv("LOG_REDACT", "1") == "1"  # foydalanuvchi/model matni log'ga yozilmaydi
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1.0))  # har-update debug qatorlarining ulushi
+
+class Sensitive:
+    """Log argumenti: LOG_REDACT yoqilgan bo'lsa matn o'rniga faqat uzunligi chiqadi"""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        text = str(self.value)
+        return f"<{len(text)} belgi>" if LOG_REDACT else text
+
+class RedactFilter(logging.Filter):
+    """Token va API kalitini har qanday log qatoridan (kutubxonalarnikidan ham) olib tashlash"""
+
+    def __init__(self, secrets: list):
+        super().__init__()
+        # Juda qisqa qiymatlar (test kalitlari) oddiy so'zlarni ham buzadi
+        self.secrets = [secret for secret in secrets if secret and len(secret) >= 8]
+
+    def _redact(self, text: str) -> str:
+        for secret in self.secrets:
+            if secret in text:
+                text = text.replace(secret, secret[:4] + "***")
+        return text
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg, record.args = self._redact(record.getMessage()), None
+        if record.exc_info and not record.exc_text:
+            # Traceback ham (masalan, so'rov URL'idagi token) tozalanadi
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        if record.exc_text:
+            record.exc_text = self._redact(record.exc_text)
+        return True
+
+class SampleFilter(logging.Filter):
+    """Har-update INFO/DEBUG qatorlaridan `rate` ulushini qoldirish.
+
+    update_id bo'lsa tanlov unga bog'liq: bitta update'ning qatorlari birga qoladi.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        update_id = getattr(record, "update_id", None)
+        if update_id is None:
+            return random.random() < self.rate
+        return (update_id * 2654435761) % 2**32 < self.rate * 2**32
+
+class JsonFormatter(logging.Formatter):
+    EXTRA_FIELDS = ("update_id", "user_id")
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in self.EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        elif record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler.prepare() traceback'ni msg ichiga qo'shib yuboradi; bu yerda
+    msg faqat xabar, traceback esa exc_text da qoladi (JSON'da alohida "exc")."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            # Traceback obyektlari navbatdan o'tkazilmaydi, matni yetarli
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def setup_logging():
+    output = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    output.addFilter(RedactFilter([os.getenv("BOT_TOKEN"), os.getenv("GROQ_API_KEY")]))
+    
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    if LOG_QUEUE:
+        # Yozish alohida thread'da; chaqiruvchi faqat navbatga qo'yadi
+        log_queue = queue.SimpleQueue()
+        root.addHandler(StructuredQueueHandler(log_queue))
+        listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+    else:
+        root.addHandler(output)
+
+setup_logging()
 logger = logging.getLogger(__name__)
+update_logger = logger.getChild("updates")  # har-update qatorlari (sampling bilan)
+update_logger.addFilter(SampleFilter(LOG_SAMPLE_RATE))
 
 # 🔑 API Keys
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # setWebhook secret_token; har so'rovda header bilan tekshiriladi
+UPDATE_DEDUPE_WINDOW = int(os.getenv("UPDATE_DEDUPE_WINDOW", 10000))  # eslab qolinadigan oxirgi update_id'lar
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")  # lokal Bot API server yoki bench/fake_telegram.py
 PORT = int(os.getenv("PORT", 10000))
 
+# ⚙️ Sozlamalar
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", 8))
+UPDATE_BACKLOG = int(os.getenv("UPDATE_BACKLOG", 1000))
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", 30))
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", 10))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", 2))
+GROQ_MAX_RETRY_DELAY = float(os.getenv("GROQ_MAX_RETRY_DELAY", 10))
+GROQ_STREAM = os.getenv("GROQ_STREAM", "1") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", 1.0))
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", 1000))
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", 3600))
+CHAT_CACHE_FIRST_TURN_ONLY = os.getenv("CHAT_CACHE_FIRST_TURN_ONLY", "0") == "1"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")  # memory | sqlite
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_TTL = float(os.getenv("SESSION_TTL", 7 * 24 * 3600))
+SESSION_MAX = int(os.getenv("SESSION_MAX", 100000))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", 300))
+CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", 40))  # sessiyada saqlanadigan xabarlar
+CHAT_PROMPT_BUDGET = int(os.getenv("CHAT_PROMPT_BUDGET", 3000))  # prompt uchun token byudjeti
+CHAT_SUMMARIZE = os.getenv("CHAT_SUMMARIZE", "0") == "1"
+CHAT_SUMMARY_BUDGET = int(os.getenv("CHAT_SUMMARY_BUDGET", 200))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", os.cpu_count() or 2))
+IMAGE_POOL = os.getenv("IMAGE_POOL", "process")  # process | thread
+SPILL_THRESHOLD = int(os.getenv("SPILL_THRESHOLD", 32 * 1024 * 1024))  # foydalanuvchi boshiga xotiradagi baytlar
+# DejaVuSans*.ttf joyi (repoda yo'q): masalan `apt install fonts-dejavu-core` va
+# FONT_DIR=/usr/share/fonts/truetype/dejavu. Topilmasa faqat Word → PDF o'chadi
+FONT_DIR = os.getenv("FONT_DIR", ".")
+BLOB_CACHE_BYTES = int(os.getenv("BLOB_CACHE_BYTES", 256 * 1024 * 1024))  # yuklangan fayllar keshi chegarasi
+DATA_DIR = os.getenv("DATA_DIR", "data")  # foydalanuvchi fayllari, blob va bus papkalari ildizi
+BLOB_DIR = os.getenv("BLOB_DIR", os.path.join(DATA_DIR, "blobs"))
+CLEANUP_INTERVAL = float(os.getenv("CLEANUP_INTERVAL", 300))  # disk reaper o'tishlari orasidagi vaqt (s)
+DATA_TTL = float(os.getenv("DATA_TTL", 24 * 3600))  # tashlab ketilgan data/{user_id}/ papkalar muddati
+DATA_QUOTA_BYTES = int(os.getenv("DATA_QUOTA_BYTES", 0))  # data/ uchun disk kvotasi (0 — cheklovsiz), workerlarga teng bo'linadi
+CLEANUP_BATCH = int(os.getenv("CLEANUP_BATCH", 200))  # shuncha o'chirish yig'ilsa reaper navbatdan tashqari ishlaydi
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", 4))  # foydalanuvchi boshiga parallel yuklashlar
+ALBUM_ACK_DELAY = float(os.getenv("ALBUM_ACK_DELAY", 1.0))  # "Rasm saqlandi" xabarini kechiktirish (s)
+CONVERT_WORKERS = int(os.getenv("CONVERT_WORKERS", 2))  # bir vaqtda ishlaydigan konvertatsiyalar
+CONVERT_QUEUE = int(os.getenv("CONVERT_QUEUE", 100))  # navbatdagi ishlar chegarasi
+CONVERT_WARMUP = os.getenv("CONVERT_WARMUP", "1") == "1"  # konvertatsiya kutubxonalarini startdan keyin fonda yuklash
+STREAM_THRESHOLD = int(os.getenv("STREAM_THRESHOLD", 16 * 1024 * 1024))  # kirish shundan katta bo'lsa oqimli rejim
+# Token bucket limitlari: *_RATE — daqiqasiga, *_BURST — ketma-ket ruxsat; global 0 — cheklovsiz
+CHAT_RATE = float(os.getenv("CHAT_RATE", 20))
+CHAT_BURST = float(os.getenv("CHAT_BURST", 5))
+CHAT_GLOBAL_RATE = float(os.getenv("CHAT_GLOBAL_RATE", 0))  # Groq kvotasi (barcha foydalanuvchilar)
+DOWNLOAD_RATE = float(os.getenv("DOWNLOAD_RATE", 60))
+DOWNLOAD_BURST = float(os.getenv("DOWNLOAD_BURST", 30))
+DOWNLOAD_GLOBAL_RATE = float(os.getenv("DOWNLOAD_GLOBAL_RATE", 0))
+CONVERT_RATE = float(os.getenv("CONVERT_RATE", 6))
+CONVERT_BURST = float(os.getenv("CONVERT_BURST", 2))
+CONVERT_GLOBAL_RATE = float(os.getenv("CONVERT_GLOBAL_RATE", 0))
+RATE_LIMIT_USERS = int(os.getenv("RATE_LIMIT_USERS", 100000))  # xotirada saqlanadigan bucketlar chegarasi
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 1))  # >1: ingress + N ta worker jarayon (webhook rejimi)
+WORKER_INDEX = os.getenv("WORKER_INDEX")  # worker jarayonlariga ingress o'rnatadi
+BUS_DIR = os.getenv("BUS_DIR", os.path.join(DATA_DIR, "bus"))  # ingress -> worker Unix socketlari
+STREAM_MEMORY_BUDGET = int(os.getenv("STREAM_MEMORY_BUDGET", 64 * 1024 * 1024))  # oqimli rejimda ishlanayotgan rasmlar baytlari
+
 if not BOT_TOKEN or not GROQ_API_KEY:
     print("❌ XATOLIK: .env faylda BOT_TOKEN va GROQ_API_KEY topilmadi!")
     exit(1)
 
-# 📊 Foydalanuvchi ma'lumotlari
-USER_STATE = {}
-USER_DATA = {}
-CHAT_HISTORY = {}
+# 📈 Prometheus metrikalari (/metrics)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def format_labels(names: tuple, values: tuple) -> str:
+    """('status',), ('200',) -> {status="200"}"""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    """Prometheus histogrammasi; label qiymatlari observe() ga tartib bilan beriladi"""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket hisoblari, yig'indi, soni]
+
+    def observe(self, value: float, *labels, count: int = 1):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += count
+        series[1] += value * count
+        series[2] += count
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = format_labels(self.labelnames + ("le",), labels + (le,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class Gauge:
+    """Qiymati scrape paytida callback orqali o'qiladigan gauge"""
+
+    def __init__(self, name: str, help_text: str, callback):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+
+    def render(self) -> list:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge",
+                f"{self.name} {self.callback()}"]
+
+class Counter:
+    """Faqat o'sadigan hisoblagich; label qiymatlari inc() ga tartib bilan beriladi"""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}  # labels -> qiymat
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error("Metrika xatolik (%s): %s", metric.name, e)
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+UPDATE_QUEUE_WAIT = metrics.histogram("bot_update_queue_wait_seconds", "Update dispatcher navbatida kutish vaqti")
+HANDLER_LATENCY = metrics.histogram("bot_handler_seconds", "Handler bajarilish vaqti", ("command",))
+GROQ_LATENCY = metrics.histogram("bot_groq_request_seconds", "Groq HTTP so'rovi vaqti (har urinish)", ("status",))
+WEBHOOK_UPDATES = metrics.counter("bot_webhook_updates_total", "Webhook'ga kelgan update'lar natijasi", ("result",))
+WEBHOOK_SKIPPED_BYTES = metrics.counter(
+    "bot_webhook_parse_skipped_bytes_total", "Deserializatsiya qilinmay tashlangan update baytlari"
+)
+DISK_RECLAIMED = metrics.counter("bot_disk_reclaimed_bytes_total", "Disk reaper bo'shatgan baytlar")
+DISK_REAPED = metrics.counter("bot_disk_reaped_total", "O'chirishga yuborilgan fayl/papkalar", ("reason",))
+RATE_LIMITED = metrics.counter("bot_rate_limited_total", "Limit sabab rad etilgan so'rovlar", ("kind", "scope"))
+DOWNLOAD_TIME = metrics.histogram("bot_download_seconds", "Telegram'dan fayl yuklash vaqti")
+PDF_PAGE_TIME = metrics.histogram(
+    "bot_pdf_render_seconds_per_page", "PDF yaratish vaqti, sahifaga bo'lingan", ("kind",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# 📏 Token hisoblash (tez, lokal evristika)
+MESSAGE_TOKEN_OVERHEAD = 4  # role va ajratuvchilar uchun
+
+def estimate_tokens(text: str) -> int:
+    """Taxminiy token soni: Llama tokenizer'i uchun ~3 belgi = 1 token (krill/lotin aralash matnda xavfsiz tomonga)"""
+    return (len(text) + 2) // 3 + MESSAGE_TOKEN_OVERHEAD
+
+def history_entry(role: str, content: str, tokens: int = None) -> tuple:
+    """Tarix yozuvi: (role, content, tokens); token soni bir marta hisoblanadi"""
+    return (role, content, tokens if tokens is not None else estimate_tokens(content))
+
+# 📊 Foydalanuvchi ma'lumotlari (sessiyalar)
+class Session:
+    """Bitta foydalanuvchining holati: menyu holati, fayllar va chat tarixi"""
+
+    __slots__ = ("user_id", "state", "data", "history", "last_seen")
+
+    def __init__(self, user_id: int, state: str = "main", data=None, history=(), last_seen: float = 0.0):
+        self.user_id = user_id
+        self.state = state
+        self.data = data
+        # (role, content, tokens) yozuvlari; eskilari avtomatik tushib qoladi
+        self.history = deque((history_entry(*item) for item in history), maxlen=CHAT_HISTORY_LIMIT)
+        self.last_seen = last_seen
+
+class MemorySessionStore:
+    """Jarayon ichidagi sessiyalar: LRU tartib, idle TTL va maksimal son"""
+
+    def __init__(self, ttl: float = SESSION_TTL, max_entries: int = SESSION_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._sessions = OrderedDict()
+        self.evictions = 0
+        self.on_expire = None  # user_id -> None: sessiya fayllari havolalarini bo'shatish
+
+    def _expired(self, user_id: int):
+        if self.on_expire is not None:
+            self.on_expire(user_id)
+
+    def get(self, user_id: int) -> Session:
+        """Sessiyani olish (yo'q yoki muddati o'tgan bo'lsa yangisi)"""
+        now = time.time()
+        session = self._sessions.get(user_id)
+        if session is None or now - session.last_seen > self.ttl:
+            if session is not None:
+                self._expired(user_id)
+            session = Session(user_id)
+            self._sessions[user_id] = session
+            while len(self._sessions) > self.max_entries:
+                evicted, _ = self._sessions.popitem(last=False)
+                self.evictions += 1
+                self._expired(evicted)
+        session.last_seen = now
+        self._sessions.move_to_end(user_id)
+        return session
+
+    def save(self, session: Session):
+        session.last_seen = time.time()
+
+    def sweep(self) -> int:
+        """Muddati o'tgan sessiyalarni o'chirish"""
+        deadline = time.time() - self.ttl
+        expired = 0
+        # LRU tartibda: eng eskilari boshida
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if session.last_seen >= deadline:
+                break
+            del self._sessions[user_id]
+            expired += 1
+            self._expired(user_id)
+        self.evictions += expired
+        return expired
+
+    def last_seen(self, user_id: int):
+        """Oxirgi faollik vaqti (yangilamasdan); sessiya yo'q bo'lsa None"""
+        session = self._sessions.get(user_id)
+        return session.last_seen if session is not None else None
+
+    def clear_data(self, user_id: int):
+        """Sessiyadagi fayl havolalarini unutish (last_seen o'zgarmaydi)"""
+        session = self._sessions.get(user_id)
+        if session is not None:
+            session.data = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def close(self):
+        pass
+
+class SqliteSessionStore:
+    """SQLite sessiyalar: restartdan keyin saqlanadi, bir nechta jarayon bitta faylni ishlatishi mumkin"""
+
+    def __init__(self, path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL, max_entries: int = SESSION_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evictions = 0
+        self.on_expire = None
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " user_id INTEGER PRIMARY KEY,"
+            " state TEXT NOT NULL,"
+            " data TEXT,"
+            " history TEXT NOT NULL,"
+            " last_seen REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+
+    def get(self, user_id: int) -> Session:
+        now = time.time()
+        row = self._db.execute(
+            "SELECT state, data, history, last_seen FROM sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row is None or now - row[3] > self.ttl:
+            if row is not None and self.on_expire is not None:
+                self.on_expire(user_id)
+            return Session(user_id, last_seen=now)
+        state, data, history, _ = row
+        return Session(user_id, state, json.loads(data) if data else None, json.loads(history), now)
+
+    def save(self, session: Session):
+        session.last_seen = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions (user_id, state, data, history, last_seen) VALUES (?, ?, ?, ?, ?)",
+            (
+                session.user_id,
+                session.state,
+                json.dumps(session.data) if session.data is not None else None,
+                json.dumps(list(session.history), ensure_ascii=False),
+                session.last_seen,
+            ),
+        )
+
+    def _delete(self, user_ids: list, before: float) -> int:
+        """Sessiyalarni o'chirish (shu orada yangilanganlari qoladi)"""
+        deleted = 0
+        for user_id in user_ids:
+            if self._db.execute(
+                "DELETE FROM sessions WHERE user_id = ? AND last_seen <= ?", (user_id, before)
+            ).rowcount:
+                deleted += 1
+                if self.on_expire is not None:
+                    self.on_expire(user_id)
+        return deleted
+
+    def sweep(self) -> int:
+        """Muddati o'tgan va limitdan ortiq (eng eski) sessiyalarni o'chirish"""
+        deadline = time.time() - self.ttl
+        rows = self._db.execute("SELECT user_id FROM sessions WHERE last_seen < ?", (deadline,)).fetchall()
+        expired = self._delete([user_id for user_id, in rows], deadline)
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            rows = self._db.execute(
+                "SELECT user_id, last_seen FROM sessions ORDER BY last_seen LIMIT ?", (excess,)
+            ).fetchall()
+            expired += self._delete([user_id for user_id, _ in rows], rows[-1][1])
+        self.evictions += expired
+        return expired
+
+    def last_seen(self, user_id: int):
+        row = self._db.execute("SELECT last_seen FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def clear_data(self, user_id: int):
+        self._db.execute("UPDATE sessions SET data = NULL WHERE user_id = ?", (user_id,))
 
-# Flask app
-app = Flask(__name__)
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+def create_session_store():
+    """SESSION_BACKEND bo'yicha sessiya omborini yaratish"""
+    if SESSION_BACKEND == "sqlite":
+        return SqliteSessionStore()
+    return MemorySessionStore()
+
+sessions = create_session_store()
+
+async def sweep_sessions():
+    """Eskirgan sessiyalarni vaqti-vaqti bilan tozalash"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        try:
+            expired = sessions.sweep()
+            if expired:
+                logger.info("🧹 %d ta eski sessiya o'chirildi (qoldi: %d)", expired, len(sessions))
+        except Exception as e:
+            logger.error("Sessiya tozalash xatolik: %s", e)
 
 # Telegram bot app (global)
 telegram_app = None
-update_queue = Queue()
+
+# 🚦 Update dispatcher
+def update_user_key(json_data: dict):
+    """Update'ning egasi (from.id) bo'yicha kalit; topilmasa update_id"""
+    for value in json_data.values():
+        if isinstance(value, dict):
+            sender = value.get("from") or value.get("chat")
+            if isinstance(sender, dict) and "id" in sender:
+                return sender["id"]
+    return ("update", json_data.get("update_id"))
+
+class UpdateDispatcher:
+    """Update'larni parallel qayta ishlash, lekin bitta foydalanuvchi uchun qat'iy tartibda.
+
+    Har bir foydalanuvchining o'z navbati (lane) bor. Tayyor foydalanuvchilar
+    `_ready` queue'ga tushadi va bir paytda faqat bitta worker uni ishlaydi,
+    shuning uchun sessiyadagi holat mashinasi (state/data) buzilmaydi.
+    """
+
+    def __init__(self, handler, workers: int = UPDATE_WORKERS, max_backlog: int = UPDATE_BACKLOG):
+        self.handler = handler
+        self.workers = workers
+        self.max_backlog = max_backlog
+        self._lanes = {}
+        self._ready = asyncio.Queue()
+        self._tasks = []
+        self.backlog = 0
+        self.busy_workers = 0
+        self.peak_backlog = 0
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def submit(self, json_data: dict) -> bool:
+        """Update'ni navbatga qo'yish; backlog to'lgan bo'lsa False"""
+        if self.backlog >= self.max_backlog:
+            self.rejected += 1
+            return False
+        
+        key = update_user_key(json_data)
+        lane = self._lanes.get(key)
+        if lane is None:
+            # Yangi lane: foydalanuvchi hozir ishlanmayapti, tayyorlar qatoriga
+            lane = self._lanes[key] = deque()
+            self._ready.put_nowait(key)
+        lane.append((time.monotonic(), json_data))
+        
+        self.submitted += 1
+        self.backlog += 1
+        self.peak_backlog = max(self.peak_backlog, self.backlog)
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            lane = self._lanes[key]
+            enqueued_at, json_data = lane.popleft()
+            self.backlog -= 1
+            
+            waited = time.monotonic() - enqueued_at
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            UPDATE_QUEUE_WAIT.observe(waited)
+            
+            self.busy_workers += 1
+            try:
+                await self.handler(json_data)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("Process update xatolik: %s", e)
+            finally:
+                self.busy_workers -= 1
+                # Foydalanuvchining keyingi update'i bo'lsa, navbat oxiriga (adolatli)
+                if lane:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._lanes[key]
+
+    def start(self):
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> dict:
+        """Backpressure metrikalari"""
+        dequeued = self.submitted - self.backlog
+        return {
+            "workers": self.workers,
+            "busy_workers": self.busy_workers,
+            "backlog": self.backlog,
+            "max_backlog": self.max_backlog,
+            "peak_backlog": self.peak_backlog,
+            "active_users": len(self._lanes),
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_total / dequeued * 1000, 2) if dequeued else 0.0,
+            "max_wait_ms": round(self.wait_max * 1000, 2),
+        }
 
 # 🏥 Health check endpoint
-@app.route('/')
-def home():
-    return "✅ Bot ishlayapti!", 200
+async def home(request: web.Request) -> web.Response:
+    return web.Response(text="✅ Bot ishlayapti!")
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({
+        "status": "healthy",
+        "bot": "running",
+        "ingress": update_filter.stats(),
+        "dispatcher": dispatcher.stats(),
+        "chat_cache": response_cache.stats(),
+        "sessions": len(sessions),
+        "blob_cache": blob_cache.stats(),
+        "conversions": conversion_queue.stats(),
+        "word_pdf": font_cache.available(),
+        "disk": reaper.stats(),
+        "rate_limits": {limiter.kind: limiter.stats() for limiter in (chat_limiter, download_limiter, convert_limiter)},
+    })
 
-@app.route('/health')
-def health():
-    return {"status": "healthy", "bot": "running"}, 200
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    """Prometheus text formatidagi metrikalar"""
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Prometheus-Format": "0.0.4"})
 
-# 🪝 Webhook endpoint (SYNC)
-@app.route(f'/{BOT_TOKEN}', methods=['POST'])
-def webhook():
+# 🛂 Webhook kirish filtri: secret token, takroriy update_id va keraksiz turlar
+HANDLED_UPDATE_TYPES = ("message",)
+HANDLED_MESSAGE_FIELDS = ("text", "photo", "document")  # handlerlar ishlaydigan xabar turlari
+# Telegram update_id ni birinchi, update turini ikkinchi kalit qilib yuboradi
+UPDATE_HEAD = re.compile(rb'\A\s*\{\s*"update_id"\s*:\s*(\d+)\s*,\s*"(\w+)"\s*:')
+
+class UpdateFilter:
+    """Update.de_json dan oldingi arzon tekshiruvlar.
+
+    Takroriy (Telegram qayta yuborgan) va hech bir handler ishlamaydigan
+    update'lar obyektga aylantirilmaydi; ko'pincha JSON ham to'liq
+    o'qilmaydi — update_id va tur body boshidan olinadi.
+    """
+
+    def __init__(self, secret: str = WEBHOOK_SECRET, window: int = UPDATE_DEDUPE_WINDOW):
+        self.secret = secret.encode() if secret else None
+        self.window = window
+        self._order = deque()
+        self._seen = set()
+        self.results = dict.fromkeys(("accepted", "duplicate", "filtered", "unauthorized", "invalid"), 0)
+        self.json_skipped = 0
+        self.skipped_bytes = 0
+
+    def _count(self, result: str, skipped_bytes: int = 0):
+        self.results[result] += 1
+        WEBHOOK_UPDATES.inc(result)
+        if skipped_bytes:
+            self.skipped_bytes += skipped_bytes
+            WEBHOOK_SKIPPED_BYTES.inc(amount=skipped_bytes)
+
+    def authorized(self, request: web.Request) -> bool:
+        """X-Telegram-Bot-Api-Secret-Token tekshiruvi (body o'qilishidan oldin)"""
+        if self.secret is None:
+            return True
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode()
+        if hmac.compare_digest(token, self.secret):
+            return True
+        self._count("unauthorized")
+        return False
+
+    def inspect(self, body: bytes):
+        """Qayta ishlanadigan update'ning JSON'i yoki None (tashlab yuboriladi)"""
+        head = UPDATE_HEAD.match(body)
+        if head:
+            if int(head[1]) in self._seen:
+                self.json_skipped += 1
+                self._count("duplicate", len(body))
+                return None
+            if head[2].decode() not in HANDLED_UPDATE_TYPES:
+                self.json_skipped += 1
+                self._count("filtered", len(body))
+                return None
+        
+        try:
+            json_data = json.loads(body)
+        except ValueError:
+            # Buzuq payload qayta yuborilganda ham tuzalmaydi
+            self._count("invalid")
+            return None
+        if not isinstance(json_data, dict) or not isinstance(json_data.get("update_id"), (int, type(None))):
+            # To'g'ri JSON, lekin update emas ([1, 2], "x", update_id ro'yxat va h.k.)
+            self._count("invalid")
+            return None
+        if json_data.get("update_id") in self._seen:
+            self._count("duplicate", len(body))
+            return None
+        message = json_data.get("message")
+        if not isinstance(message, dict) or not any(field in message for field in HANDLED_MESSAGE_FIELDS):
+            self._count("filtered", len(body))
+            return None
+        return json_data
+
+    def accept(self, json_data: dict):
+        """Navbatga qo'yilgan update'ni eslab qolish (rad etilganini Telegram qayta yuboradi)"""
+        self._count("accepted")
+        update_id = json_data.get("update_id")
+        if update_id is None:
+            return
+        if len(self._order) >= self.window:
+            self._seen.discard(self._order.popleft())
+        self._order.append(update_id)
+        self._seen.add(update_id)
+
+    def stats(self) -> dict:
+        return {
+            **self.results,
+            "json_parse_skipped": self.json_skipped,
+            "de_json_skipped": self.results["duplicate"] + self.results["filtered"],
+            "skipped_bytes": self.skipped_bytes,
+            "window": len(self._order),
+        }
+
+update_filter = UpdateFilter()
+
+# 🪝 Webhook endpoint (ASYNC, telegram_app bilan bitta event loop'da)
+async def webhook(request: web.Request) -> web.Response:
     """Telegram webhook handler"""
     try:
-        json_data = request.get_json(force=True)
-        logger.info(f"📨 Webhook qabul qilindi: {json_data}")
+        if not update_filter.authorized(request):
+            return web.Response(text="Forbidden", status=403)
+        json_data = update_filter.inspect(await request.read())
+        if json_data is None:
+            # Takroriy yoki keraksiz update: 200, Telegram qayta yubormasin
+            return web.Response(text="OK")
+        update_logger.debug("📨 Webhook qabul qilindi", extra={"update_id": json_data.get("update_id")})
         
-        # Update'ni queuega qo'shish
-        update_queue.put(json_data)
+        # Update'ni to'g'ridan-to'g'ri dispatcher'ga berish
+        if not dispatcher.submit(json_data):
+            # Backlog to'lgan: Telegram keyinroq qayta yuboradi
+            logger.warning("🚦 Backlog to'lgan (%d), update rad etildi", dispatcher.backlog)
+            return web.Response(text="Busy", status=503)
+        update_filter.accept(json_data)
         
-        return "OK", 200
+        return web.Response(text="OK")
     except Exception as e:
-        logger.error(f"Webhook xatolik: {e}")
-        return "Error", 500
+        logger.error("Webhook xatolik: %s", e)
+        return web.Response(text="Error", status=500)
+
+def create_web_app(webhook_handler=webhook, health_handler=health, metrics_handler=metrics_endpoint) -> web.Application:
+    """aiohttp ilovasini yaratish"""
+    web_app = web.Application()
+    web_app.router.add_get('/', home)
+    web_app.router.add_get('/health', health_handler)
+    web_app.router.add_get('/metrics', metrics_handler)
+    web_app.router.add_post(f'/{BOT_TOKEN}', webhook_handler)
+    return web_app
 
 # 🔄 Update processor (async)
-async def process_updates():
-    """Queue'dan update'larni olish va process qilish"""
-    while True:
-        try:
-            if not update_queue.empty():
-                json_data = update_queue.get()
-                update = Update.de_json(json_data, telegram_app.bot)
-                await telegram_app.process_update(update)
-                logger.info(f"✅ Update qayta ishlandi")
-        except Exception as e:
-            logger.error(f"Process update xatolik: {e}")
-        await asyncio.sleep(0.1)
+async def process_update(json_data: dict):
+    """Bitta update'ni qayta ishlash"""
+    update = Update.de_json(json_data, telegram_app.bot)
+    await telegram_app.process_update(update)
+    update_logger.debug("✅ Update qayta ishlandi", extra={"update_id": update.update_id})
+
+dispatcher = UpdateDispatcher(process_update)
+
+metrics.gauge("bot_update_backlog", "Dispatcher navbatidagi update'lar", lambda: dispatcher.backlog)
+metrics.gauge("bot_update_busy_workers", "Band dispatcher workerlari", lambda: dispatcher.busy_workers)
+metrics.gauge("bot_conversion_queue_depth", "Navbatdagi PDF konvertatsiyalari", lambda: len(conversion_queue._queue))
+metrics.gauge("bot_conversions_running", "Ishlayotgan PDF konvertatsiyalari", lambda: conversion_queue.running)
+metrics.gauge("bot_sessions", "Sessiya omboridagi yozuvlar", lambda: len(sessions))
+metrics.gauge("bot_blob_cache_bytes", "Fayl keshi hajmi (bayt)", lambda: blob_cache.size)
+metrics.gauge("bot_data_dir_bytes", "data/ papkasi hajmi (oxirgi skan)", lambda: reaper.usage)
 
 # 📹 Asosiy menyu
 def main_menu():
@@ -111,31 +839,366 @@ def word_menu():
         resize_keyboard=True
     )
 
-# 🤖 Groq API Chatbot
-async def chatbot_reply(user_text: str, user_id: int) -> str:
-    """Groq Llama 3.3 70B model bilan suhbat"""
-    try:
-        # Chat tarixini boshlash
-        if user_id not in CHAT_HISTORY:
-            CHAT_HISTORY[user_id] = []
+# 🔌 Groq HTTP klient (async, keep-alive pool)
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+class GroqError(Exception):
+    """Groq 200 dan boshqa status qaytardi"""
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"Groq API xatolik {status_code}")
+        self.status_code = status_code
+        self.text = text
+
+class GroqClient:
+    """Umumiy connection pool, HTTP/2, retry va parallel so'rovlar limiti bilan Groq klienti"""
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, api_key: str, url: str = GROQ_API_URL, timeout: float = GROQ_TIMEOUT,
+                 max_concurrency: int = GROQ_MAX_CONCURRENCY, max_retries: int = GROQ_MAX_RETRIES):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = httpx.Timeout(timeout, connect=min(timeout, 10.0))
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._client = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Klient birinchi so'rovda, ishlayotgan event loop ichida yaratiladi
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                    keepalive_expiry=60,
+                ),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+            )
+        return self._client
+
+    def _retry_delay(self, response: httpx.Response, attempt: int):
+        """Keyingi urinishgacha kutish (soniya); Retry-After juda uzun bo'lsa None"""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                delay = None
+            if delay is not None:
+                return delay if delay <= GROQ_MAX_RETRY_DELAY else None
+        # Eksponensial backoff + jitter
+        return min(GROQ_MAX_RETRY_DELAY, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def post(self, payload: dict, timeout: float = None) -> httpx.Response:
+        """Chat completions so'rovi; 429/5xx bo'lsa cheklangan marta qayta urinadi"""
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                started = time.monotonic()
+                try:
+                    response = await self.client.post(
+                        self.url,
+                        json=payload,
+                        timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+                    )
+                except httpx.HTTPError:
+                    GROQ_LATENCY.observe(time.monotonic() - started, "error")
+                    raise
+                GROQ_LATENCY.observe(time.monotonic() - started, str(response.status_code))
+            
+            if response.status_code not in self.RETRY_STATUSES or attempt >= self.max_retries:
+                return response
+            
+            delay = self._retry_delay(response, attempt)
+            if delay is None:
+                return response
+            
+            attempt += 1
+            logger.warning("🔁 Groq %s, %.1fs dan keyin qayta urinish (%d/%d)", response.status_code, delay, attempt, self.max_retries)
+            await asyncio.sleep(delay)
+
+    async def stream(self, payload: dict):
+        """SSE (`stream: true`) javobidan matn bo'laklarini (delta) ketma-ket qaytarish.
+
+        Qayta urinish faqat birinchi baytdan oldin (status bo'yicha) bo'ladi.
+        """
+        payload = {**payload, "stream": True}
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                started = time.monotonic()
+                status = "error"
+                try:
+                    async with self.client.stream("POST", self.url, json=payload) as response:
+                        status = str(response.status_code)
+                        if response.status_code == 200:
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[5:].strip()
+                                if data == "[DONE]":
+                                    return
+                                chunk = json.loads(data)
+                                choices = chunk.get("choices") or [{}]
+                                delta = choices[0].get("delta", {}).get("content")
+                                if delta:
+                                    yield delta
+                            return
+                        
+                        await response.aread()
+                finally:
+                    # Stream uchun: so'rovdan oxirgi tokengacha
+                    GROQ_LATENCY.observe(time.monotonic() - started, status)
+                
+                delay = None
+                if response.status_code in self.RETRY_STATUSES and attempt < self.max_retries:
+                    delay = self._retry_delay(response, attempt)
+                if delay is None:
+                    raise GroqError(response.status_code, response.text)
+            
+            attempt += 1
+            logger.warning("🔁 Groq %s, %.1fs dan keyin qayta urinish (%d/%d)", response.status_code, delay, attempt, self.max_retries)
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+groq_client = GroqClient(GROQ_API_KEY)
+
+# ✏️ Javobni bosqichma-bosqich ko'rsatish (streaming)
+TELEGRAM_TEXT_LIMIT = 4096
+
+class StreamingEditor:
+    """Placeholder xabarni token kelishi bilan tahrirlash.
+
+    Telegram tahrirlash limitlari sababli tahrirlar STREAM_EDIT_INTERVAL dan
+    tez-tez yuborilmaydi; oraliqdagi matn keyingi tahrirda ko'rsatiladi.
+    """
+
+    def __init__(self, message, interval: float = STREAM_EDIT_INTERVAL, cursor: str = " ▌"):
+        self.message = message
+        self.interval = interval
+        self.cursor = cursor
+        self.shown_text = None
+        self.next_edit_at = 0.0
+        self.edits = 0
+
+    async def _edit(self, text: str) -> bool:
+        """Tahrirlash; muvaffaqiyatsiz bo'lsa False (xatolik chaqiruvchiga chiqmaydi)"""
+        if text == self.shown_text:
+            return True
+        try:
+            await self.message.edit_text(text)
+            self.shown_text = text
+            self.edits += 1
+            return True
+        except RetryAfter as e:
+            # Telegram sekinlashtirishni so'radi
+            self.next_edit_at = time.monotonic() + e.retry_after
+        except BadRequest as e:
+            if "not modified" in str(e):
+                self.shown_text = text
+                return True
+            logger.warning("✏️ Tahrirlash xatolik: %s", e)
+        except TelegramError as e:
+            # Tarmoq xatolari (NetworkError, TimedOut): oraliq tahrir o'tkazib yuboriladi
+            logger.warning("✏️ Tahrirlash o'tkazib yuborildi: %s", e)
+        return False
+
+    async def update(self, text: str):
+        """Oraliq matn (limitdan tez kelsa o'tkazib yuboriladi)"""
+        now = time.monotonic()
+        if now < self.next_edit_at:
+            return
+        self.next_edit_at = now + self.interval
+        await self._edit(text[:TELEGRAM_TEXT_LIMIT - len(self.cursor)] + self.cursor)
+
+    async def finish(self, text: str):
+        """Yakuniy matn; 4096 belgidan uzun bo'lsa qolgani yangi xabarlarda"""
+        parts = [text[i:i + TELEGRAM_TEXT_LIMIT] for i in range(0, len(text), TELEGRAM_TEXT_LIMIT)] or [text]
+        if not await self._edit(parts[0]):
+            # Yakuniy matn yo'qolmasligi kerak: bir marta qayta urinish, keyin yangi xabar
+            await asyncio.sleep(min(max(self.next_edit_at - time.monotonic(), 0.5), 5.0))
+            if not await self._edit(parts[0]):
+                await self.message.reply_text(parts[0])
+        for part in parts[1:]:
+            await self.message.reply_text(part)
+
+# 🧠 Token byudjeti bo'yicha kontekst
+SYSTEM_PROMPT = "Sen o'zbekcha gaplashadigan do'stona yordamchi botsiz. Har doim O'ZBEKCHA javob ber. Qisqa va tushunarli javoblar ber. Emoji ishlataveringchi."
+SYSTEM_PROMPT_TOKENS = estimate_tokens(SYSTEM_PROMPT)
+
+def summarize_turns(entries: list, budget: int) -> str:
+    """Byudjetga sig'magan eski xabarlardan qisqa (ekstraktiv) xulosa"""
+    lines = []
+    remaining = budget
+    # Yangiroq xabarlar muhimroq: oxiridan boshlab
+    for role, content, _ in reversed(entries):
+        prefix = "Foydalanuvchi" if role == "user" else "Bot"
+        line = f"{prefix}: {' '.join(content.split())[:120]}"
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+    if not lines:
+        return ""
+    return "Oldingi suhbatdan qisqacha:\n" + "\n".join(reversed(lines))
+
+def build_context(session: Session, budget: int = CHAT_PROMPT_BUDGET) -> list:
+    """System prompt + byudjetga sig'adigan eng so'nggi xabarlar.
+
+    Oxirgi (joriy) xabar har doim kiradi; o'zi byudjetdan katta bo'lsa qisqartiriladi.
+    """
+    remaining = budget - SYSTEM_PROMPT_TOKENS
+    if CHAT_SUMMARIZE:
+        remaining -= CHAT_SUMMARY_BUDGET
+    
+    history = list(session.history)
+    picked = []
+    for index in range(len(history) - 1, -1, -1):
+        role, content, tokens = history[index]
+        if tokens > remaining:
+            if not picked:
+                # Juda uzun joriy xabar: byudjetga sig'adigan qismini olish
+                content = content[:max(0, remaining - MESSAGE_TOKEN_OVERHEAD) * 3]
+                picked.append({"role": role, "content": content})
+                index -= 1
+            break
+        picked.append({"role": role, "content": content})
+        remaining -= tokens
+    else:
+        index = -1
+    
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if CHAT_SUMMARIZE and index >= 0:
+        summary = summarize_turns(history[:index + 1], CHAT_SUMMARY_BUDGET)
+        if summary:
+            messages.append({"role": "system", "content": summary})
+    messages.extend(reversed(picked))
+    return messages
+
+# 🗃 Takroriy so'rovlar uchun javob keshi
+class ResponseCache:
+    """LRU + TTL kesh: eng eski ishlatilgan yozuv birinchi chiqariladi, muddati o'tgani o'chiriladi"""
+
+    def __init__(self, maxsize: int = CHAT_CACHE_SIZE, ttl: float = CHAT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(messages: list) -> str:
+        """System prompt + tarix oynasi + foydalanuvchi matnidan normallashtirilgan kalit"""
+        normalized = [
+            (message["role"], " ".join(message["content"].split()).casefold())
+            for message in messages
+        ]
+        return hashlib.sha256(json.dumps(normalized, ensure_ascii=False).encode()).hexdigest()
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
         
-        # Foydalanuvchi xabarini qo'shish
-        CHAT_HISTORY[user_id].append({"role": "user", "content": user_text})
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
         
-        # Tarixni cheklash (oxirgi 6 ta xabar = 3 ta suhbat)
-        if len(CHAT_HISTORY[user_id]) > 6:
-            CHAT_HISTORY[user_id] = CHAT_HISTORY[user_id][-6:]
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: str):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+response_cache = ResponseCache()
+
+# 🤖 Groq API Chatbot
+def groq_error_reply(error: GroqError, session: Session) -> str:
+    """Groq xatolik statusiga qarab foydalanuvchiga javob"""
+    logger.error("❌ Groq API xatolik %s: %.300s", error.status_code, error.text)
+    
+    # Xatolik turiga qarab javob
+    if error.status_code == 401:
+        return "❌ API kaliti noto'g'ri. Admin bilan bog'laning."
+    elif error.status_code == 429:
+        return "⏳ Juda ko'p so'rov. 1 daqiqa kutib, qayta urinib ko'ring."
+    elif error.status_code == 400:
+        # Tarixni tozalash va qaytadan urinish
+        session.history.clear()
+        sessions.save(session)
+        return "🔄 Xatolik yuz berdi. Yangi suhbat boshlaymiz. Iltimos, qaytadan yozing."
+    else:
+        return f"❌ Xatolik ({error.status_code}). Keyinroq urinib ko'ring."
+
+async def chatbot_reply(user_text: str, user_id: int, on_delta=None) -> str:
+    """Groq Llama 3.3 70B model bilan suhbat.
+
+    `on_delta` berilsa va GROQ_STREAM yoqilgan bo'lsa, javob SSE orqali
+    oqim bilan olinadi va har bir bo'lakdan keyin `on_delta(matn)` chaqiriladi.
+    """
+    session = sessions.get(user_id)
+    try:
+        # Foydalanuvchi xabarini qo'shish (deque oxirgi CHAT_HISTORY_LIMIT tasini saqlaydi)
+        session.history.append(history_entry("user", user_text))
         
-        # Messages array yaratish (system message + user history)
-        messages = [
-            {
-                "role": "system",
-                "content": "Sen o'zbekcha gaplashadigan do'stona yordamchi botsiz. Har doim O'ZBEKCHA javob ber. Qisqa va tushunarli javoblar ber. Emoji ishlataveringchi."
-            }
-        ]
+        # Messages array yaratish (system message + token byudjetiga sig'adigan tarix)
+        messages = build_context(session)
         
-        # Chat tarixini qo'shish
-        messages.extend(CHAT_HISTORY[user_id])
+        # Keshdan javob (first-turn rejimida faqat suhbatning birinchi xabari)
+        cache_key = None
+        if response_cache.maxsize > 0 and (not CHAT_CACHE_FIRST_TURN_ONLY or len(session.history) == 1):
+            cache_key = ResponseCache.make_key(messages)
+            cached_reply = response_cache.get(cache_key)
+            if cached_reply is not None:
+                session.history.append(history_entry("assistant", cached_reply))
+                sessions.save(session)
+                update_logger.debug("🗃 Javob keshdan olindi", extra={"user_id": user_id})
+                return cached_reply
         
         # API so'rovini yuborish (system message bilan)
         payload = {
@@ -145,75 +1208,186 @@ async def chatbot_reply(user_text: str, user_id: int) -> str:
             "max_tokens": 400
         }
         
-        logger.info(f"📤 Groq so'rovi yuborilmoqda...")
-        logger.info(f"🔑 API Key boshi: {GROQ_API_KEY[:20]}..." if GROQ_API_KEY else "❌ API Key yo'q!")
-        logger.info(f"📝 Payload: {payload}")
-        
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {GROQ_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json=payload,
-            timeout=30
-        )
-        
-        logger.info(f"📥 Groq response status: {response.status_code}")
-        
-        # Xatolik bo'lsa, to'liq response'ni log qilish
-        if response.status_code != 200:
-            try:
-                error_json = response.json()
-                logger.error(f"📄 Xatolik JSON: {error_json}")
-            except:
-                logger.error(f"📄 Xatolik TEXT: {response.text}")
+        update_logger.debug("📤 Groq so'rovi yuborilmoqda: %d ta xabar", len(messages), extra={"user_id": user_id})
         
-        if response.status_code == 200:
-            result = response.json()
-            bot_reply = result["choices"][0]["message"]["content"]
+        if on_delta is not None and GROQ_STREAM:
+            # Streaming rejimi: tokenlar kelishi bilan ko'rsatiladi
+            bot_reply = ""
+            async for delta in groq_client.stream(payload):
+                bot_reply += delta
+                await on_delta(bot_reply)
             
-            # Assistant javobini tarixga qo'shish
-            CHAT_HISTORY[user_id].append({"role": "assistant", "content": bot_reply})
+            if not bot_reply:
+                raise GroqError(200, "Bo'sh javob")
+        else:
+            response = await groq_client.post(payload)
             
-            logger.info(f"✅ Javob muvaffaqiyatli olindi: {bot_reply[:50]}...")
-            return bot_reply
+            update_logger.debug("📥 Groq response status: %s", response.status_code, extra={"user_id": user_id})
             
-        else:
-            error_text = response.text
-            logger.error(f"❌ Groq API xatolik {response.status_code}")
-            logger.error(f"📄 Xatolik matni: {error_text}")
+            # Xatolik matni groq_error_reply'da qisqartirib log qilinadi
+            if response.status_code != 200:
+                raise GroqError(response.status_code, response.text)
             
-            # Xatolik turiga qarab javob
-            if response.status_code == 401:
-                return "❌ API kaliti noto'g'ri. Admin bilan bog'laning."
-            elif response.status_code == 429:
-                return "⏳ Juda ko'p so'rov. 1 daqiqa kutib, qayta urinib ko'ring."
-            elif response.status_code == 400:
-                # Tarixni tozalash va qaytadan urinish
-                CHAT_HISTORY[user_id] = []
-                return "🔄 Xatolik yuz berdi. Yangi suhbat boshlaymiz. Iltimos, qaytadan yozing."
-            else:
-                return f"❌ Xatolik ({response.status_code}). Keyinroq urinib ko'ring."
+            result = response.json()
+            bot_reply = result["choices"][0]["message"]["content"]
+        
+        # Assistant javobini tarixga qo'shish
+        session.history.append(history_entry("assistant", bot_reply))
+        sessions.save(session)
+        
+        if cache_key is not None:
+            response_cache.put(cache_key, bot_reply)
         
-    except requests.exceptions.Timeout:
+        update_logger.info("✅ Javob olindi: %s", Sensitive(bot_reply[:50]), extra={"user_id": user_id})
+        return bot_reply
+    
+    except GroqError as e:
+        return groq_error_reply(e, session)
+        
+    except httpx.TimeoutException:
         logger.error("⏱️ Groq API timeout")
         return "⏱️ Server javob bermadi. Qaytadan urinib ko'ring."
         
-    except requests.exceptions.ConnectionError:
+    except httpx.TransportError:
         logger.error("🌐 Internetga ulanishda xatolik")
         return "🌐 Internet bilan bog'lanishda muammo."
         
     except Exception as e:
-        logger.error(f"❌ Chatbot kutilmagan xatolik: {str(e)}")
-        logger.exception(e)  # To'liq stack trace
+        logger.exception("❌ Chatbot kutilmagan xatolik: %s", e)  # To'liq stack trace bilan
         return "❌ Kutilmagan xatolik. Qaytadan urinib ko'ring."
 
+# ⏱ Handler vaqtini o'lchash (komanda bo'yicha)
+MENU_COMMANDS = {
+    "🖼 Image → PDF": "image_menu",
+    "📄 Word → PDF": "word_menu",
+    "✅ Create PDF": "create_pdf",
+    "🔙 Back": "back",
+}
+
+def command_label(update: Update) -> str:
+    """Metrika label'i: cheklangan qiymatlar to'plami (foydalanuvchi matni emas)"""
+    message = update.effective_message
+    if message is None:
+        return "other"
+    if message.text is not None:
+        if message.text.startswith("/start"):
+            return "start"
+        return MENU_COMMANDS.get(message.text, "chat")
+    if message.photo:
+        return "photo"
+    if message.document:
+        return "document"
+    return "other"
+
+def instrumented(handler):
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        started = time.monotonic()
+        try:
+            return await handler(update, context)
+        finally:
+            HANDLER_LATENCY.observe(time.monotonic() - started, command_label(update))
+    wrapper.__name__ = handler.__name__
+    wrapper.__doc__ = handler.__doc__
+    return wrapper
+
+# 🚦 Rate limit: token bucket (foydalanuvchi + global)
+class TokenBucket:
+    __slots__ = ("tokens", "updated", "notified_until")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.notified_until = 0.0
+
+    def refill(self, rate: float, burst: float, now: float):
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+class RateLimiter:
+    """Har bir foydalanuvchiga va umumiy byudjetga token bucket.
+
+    Tekshiruv O(1). Bucketlar LRU tartibida saqlanadi: to'lib bo'lgan (ya'ni
+    yangisidan farqi yo'q) bucketlar va max_users dan oshganlar o'chiriladi.
+    Ko'p jarayonli rejimda global byudjet workerlar orasida teng bo'linadi.
+    """
+
+    def __init__(self, kind: str, rate: float, burst: float, global_rate: float = 0,
+                 max_users: int = RATE_LIMIT_USERS):
+        self.kind = kind
+        self.rate = rate / 60
+        self.burst = max(burst, 1)
+        self.global_rate = global_rate / 60 / max(WORKER_PROCESSES, 1)
+        self.global_burst = max(self.burst, self.global_rate * 10)
+        self.max_users = max_users
+        self.idle = self.burst / self.rate if self.rate > 0 else 0
+        self._buckets = OrderedDict()  # user_id -> TokenBucket
+        self._global = TokenBucket(self.global_burst, time.monotonic())
+        self.allowed = 0
+        self.limited = {"user": 0, "global": 0}
+
+    def _evict(self, now: float):
+        while self._buckets:
+            user_id, bucket = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_users and now - bucket.updated < self.idle:
+                break
+            del self._buckets[user_id]
+
+    def check(self, user_id: int, cost: float = 1) -> float:
+        """0 — ruxsat (tokenlar yechildi), aks holda necha soniyadan keyin urinish mumkin"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.burst, now)
+            self._evict(now)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket.refill(self.rate, self.burst, now)
+        
+        if bucket.tokens < cost:
+            self.limited["user"] += 1
+            RATE_LIMITED.inc(self.kind, "user")
+            return (cost - bucket.tokens) / self.rate
+        if self.global_rate > 0:
+            self._global.refill(self.global_rate, self.global_burst, now)
+            if self._global.tokens < cost:
+                self.limited["global"] += 1
+                RATE_LIMITED.inc(self.kind, "global")
+                return (cost - self._global.tokens) / self.global_rate
+            self._global.tokens -= cost
+        bucket.tokens -= cost
+        self.allowed += 1
+        return 0.0
+
+    def notify_once(self, user_id: int, wait: float) -> bool:
+        """Limit davrida foydalanuvchiga bitta ogohlantirish (albom rasmlari spam qilmasin)"""
+        bucket = self._buckets.get(user_id)
+        now = time.monotonic()
+        if bucket is None or now < bucket.notified_until:
+            return False
+        bucket.notified_until = now + wait
+        return True
+
+    def stats(self) -> dict:
+        return {"users": len(self._buckets), "allowed": self.allowed, "limited": dict(self.limited)}
+
+chat_limiter = RateLimiter("chat", CHAT_RATE, CHAT_BURST, CHAT_GLOBAL_RATE)
+download_limiter = RateLimiter("download", DOWNLOAD_RATE, DOWNLOAD_BURST, DOWNLOAD_GLOBAL_RATE)
+convert_limiter = RateLimiter("convert", CONVERT_RATE, CONVERT_BURST, CONVERT_GLOBAL_RATE)
+
+async def reply_rate_limited(update: Update, limiter: RateLimiter, wait: float, text: str):
+    """Limitga tushgan foydalanuvchiga do'stona javob (davr ichida bir marta)"""
+    if limiter.notify_once(update.message.from_user.id, wait):
+        await update.message.reply_text(text.format(seconds=math.ceil(wait)))
+
 # 🎯 START komandasi
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    USER_STATE[user_id] = "main"
-    logger.info(f"👤 Foydalanuvchi {user_id} /start bosdi")
+    session = sessions.get(user_id)
+    session.state = "main"
+    sessions.save(session)
+    update_logger.info("👤 Foydalanuvchi /start bosdi", extra={"user_id": user_id})
     
     await update.message.reply_text(
         "👋 Salom! Men ko'p funksiyali botman:\n\n"
@@ -228,18 +1402,22 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     text = update.message.text
-    current_state = USER_STATE.get(user_id, "main")
+    session = sessions.get(user_id)
+    current_state = session.state
 
     if text == "🔙 Back":
-        USER_STATE[user_id] = "main"
-        USER_DATA.pop(user_id, None)
+        session.state = "main"
+        session.data = None
+        sessions.save(session)
+        discard_inputs(user_id)
         await update.message.reply_text("🏠 Asosiy menyuga qaytdingiz.", reply_markup=main_menu())
         return
 
     if text == "🖼 Image → PDF":
-        USER_STATE[user_id] = "image"
-        USER_DATA[user_id] = []
-        os.makedirs(f"data/{user_id}", exist_ok=True)
+        session.state = "image"
+        session.data = []
+        sessions.save(session)
+        discard_inputs(user_id)
         await update.message.reply_text(
             "📸 Endi rasmlarni yuboring.\n"
             "Barcha rasmlar yuborilgach '✅ Create PDF' tugmasini bosing.",
@@ -248,9 +1426,13 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if text == "📄 Word → PDF":
-        USER_STATE[user_id] = "word"
-        os.makedirs(f"data/{user_id}", exist_ok=True)
-        USER_DATA[user_id] = None
+        if not font_cache.available():
+            await update.message.reply_text(WORD_PDF_DISABLED, reply_markup=main_menu())
+            return
+        session.state = "word"
+        session.data = None
+        sessions.save(session)
+        discard_inputs(user_id)
         await update.message.reply_text(
             "📄 Endi Word faylni (.docx) yuboring.\n"
             "Tayyor bo'lgach '✅ Create PDF' tugmasini bosing.",
@@ -259,281 +1441,1810 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if text == "✅ Create PDF" and current_state == "image":
-        await create_image_pdf(update, context)
+        if not session.data:
+            await update.message.reply_text("⚠️ Rasm topilmadi.")
+            return
+        await conversion_queue.submit(update, create_image_pdf)
         return
 
     if text == "✅ Create PDF" and current_state == "word":
-        await create_word_pdf(update, context)
+        if not font_cache.available():
+            await update.message.reply_text(WORD_PDF_DISABLED, reply_markup=main_menu())
+            return
+        if not isinstance(session.data, str) or not input_exists(user_id, session.data):
+            await update.message.reply_text("❌ Avval Word fayl yuklang.")
+            return
+        await conversion_queue.submit(update, create_word_pdf)
         return
 
     if current_state == "main":
-        await update.message.reply_text("⏳ Javob tayyorlanmoqda...")
-        reply = await chatbot_reply(text, user_id)
-        await update.message.reply_text(reply)
+        wait = chat_limiter.check(user_id)
+        if wait:
+            await reply_rate_limited(update, chat_limiter, wait,
+                                     "⏳ Juda tez yozyapsiz. {seconds} soniyadan keyin yana yozing.")
+            return
+        placeholder = await update.message.reply_text("⏳ Javob tayyorlanmoqda...")
+        if GROQ_STREAM:
+            # Javob placeholder xabarida bosqichma-bosqich paydo bo'ladi
+            editor = StreamingEditor(placeholder)
+            reply = await chatbot_reply(text, user_id, on_delta=editor.update)
+            await editor.finish(reply)
+        else:
+            reply = await chatbot_reply(text, user_id)
+            await update.message.reply_text(reply)
         return
 
     await update.message.reply_text("⚠️ Iltimos, menyudan tanlang.", reply_markup=main_menu())
 
-# 🖼 Rasm yuborilganda
-async def handle_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    if USER_STATE.get(user_id) != "image":
-        return
+# 💾 Kiruvchi fayllar: file_unique_id bo'yicha umumiy kesh (xotira yoki disk)
+class Blob:
+    """Keshdagi bitta fayl: bayt yoki diskdagi yo'l, foydalanuvchilar havolalari bilan"""
+    __slots__ = ("key", "data", "path", "size", "refs", "meta")
 
-    os.makedirs(f"data/{user_id}", exist_ok=True)
+    def __init__(self, key: str, data: bytes = None, path: str = None, meta: dict = None):
+        self.key = key
+        self.data = data
+        self.path = path
+        self.size = len(data) if data is not None else os.path.getsize(path)
+        self.refs = {}  # user_id -> havolalar soni
+        self.meta = meta
 
-    if update.message.photo:
-        photo = update.message.photo[-1]
-        file = await photo.get_file()
-        path = f"data/{user_id}/{photo.file_id}.jpg"
-        await file.download_to_drive(path)
-        USER_DATA[user_id].append(path)
-        await update.message.reply_text(f"🖼 Rasm saqlandi ({len(USER_DATA[user_id])} ta).")
+    @property
+    def source(self):
+        return self.data if self.data is not None else self.path
 
-    elif update.message.document:
-        doc = update.message.document
-        if not doc.mime_type.startswith("image/"):
-            await update.message.reply_text("⚠️ Faqat rasm yuboring.")
-            return
-        file = await doc.get_file()
-        path = f"data/{user_id}/{doc.file_id}.jpg"
-        await file.download_to_drive(path)
-        USER_DATA[user_id].append(path)
-        await update.message.reply_text(f"🖼 Rasm saqlandi ({len(USER_DATA[user_id])} ta).")
+class BlobCache:
+    """Telegram file_unique_id bo'yicha fayllar keshi.
 
-# 📄 Word fayl yuborilganda
-async def handle_word(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    if USER_STATE.get(user_id) != "word":
-        return
+    Bir xil fayl qayta yuborilsa Telegram'dan qayta yuklanmaydi. Havolasi bor
+    fayllar o'chirilmaydi; havolasizlar LRU tartibida max_bytes gacha saqlanadi.
+    """
 
-    if not update.message.document:
-        await update.message.reply_text("⚠️ Iltimos, Word fayl yuboring (.docx).")
-        return
+    def __init__(self, max_bytes: int = BLOB_CACHE_BYTES, directory: str = BLOB_DIR):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.size = 0
+        self._blobs = OrderedDict()
+        self._user_keys = {}  # user_id -> {key}
+        self._user_touched = {}  # user_id -> oxirgi havola olingan vaqt (time.time)
+        self._pending = {}  # key -> yuklanayotgan faylning Future'i
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.output_hits = 0
 
-    doc = update.message.document
-    if not doc.file_name.endswith(".docx"):
-        await update.message.reply_text("⚠️ Faqat .docx formatdagi faylni yuboring.")
-        return
+    def acquire(self, key: str, user_id: int) -> bool:
+        """Fayl keshda bo'lsa foydalanuvchi havolasini qo'shish"""
+        blob = self._blobs.get(key)
+        if blob is None:
+            return False
+        self._blobs.move_to_end(key)
+        blob.refs[user_id] = blob.refs.get(user_id, 0) + 1
+        self._user_keys.setdefault(user_id, set()).add(key)
+        self._user_touched[user_id] = time.time()
+        return True
 
-    os.makedirs(f"data/{user_id}", exist_ok=True)
-    path = f"data/{user_id}/{doc.file_name}"
-    file = await doc.get_file()
-    await file.download_to_drive(path)
-    USER_DATA[user_id] = path
-    await update.message.reply_text("📄 Word fayl saqlandi. Endi '✅ Create PDF' tugmasini bosing.")
+    async def fetch(self, key: str, user_id: int, download) -> None:
+        """Keshdan olish yoki download() orqali bir marta yuklab qo'yish.
 
-# 🧾 Image → PDF funksiyasi
-async def create_image_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.message.from_user.id
-    image_files = USER_DATA.get(user_id, [])
-    if not image_files:
-        await update.message.reply_text("⚠️ Rasm topilmadi.")
-        return
+        download() (data, path) qaytaradi. Bir vaqtda kelgan bir xil fayllar
+        bitta yuklashni kutadi.
+        """
+        while not self.acquire(key, user_id):
+            pending = self._pending.get(key)
+            if pending is not None:
+                await asyncio.shield(pending)
+                continue
+            
+            self.misses += 1
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            try:
+                data, path = await download()
+                self._add(Blob(key, data=data, path=path))
+                self.acquire(key, user_id)
+            finally:
+                del self._pending[key]
+                future.set_result(None)
+            self._evict()
+            return
+        self.hits += 1
 
-    pdf_path = f"data/{user_id}/images_result.pdf"
-    
-    try:
-        await update.message.reply_text("⏳ PDF yaratilmoqda...")
-        
-        pdf = FPDF(unit="mm", format="A4")
-        processed_images = 0
+    def get(self, key: str):
+        blob = self._blobs.get(key)
+        if blob is not None:
+            self._blobs.move_to_end(key)
+        return blob
 
-        for i, img_path in enumerate(image_files):
-            try:
-                pdf.add_page()
-                with Image.open(img_path) as img:
-                    img = img.convert("RGB")
-                    
-                    img_width, img_height = img.size
-                    page_w, page_h = 210, 297
-                    margin = 10
-                    available_w = page_w - 2 * margin
-                    available_h = page_h - 2 * margin
-                    
-                    img_ratio = img_width / img_height
-                    available_ratio = available_w / available_h
-                    
-                    if img_ratio > available_ratio:
-                        new_w = available_w
-                        new_h = available_w / img_ratio
-                    else:
-                        new_h = available_h
-                        new_w = available_h * img_ratio
-                    
-                    x = margin + (available_w - new_w) / 2
-                    y = margin + (available_h - new_h) / 2
-                    
-                    temp_jpg = f"data/{user_id}/temp_{i}.jpg"
-                    
-                    max_pixels = 1200 * 1200
-                    current_pixels = img_width * img_height
-                    
-                    if current_pixels > max_pixels:
-                        scale_factor = (max_pixels / current_pixels) ** 0.5
-                        new_width = int(img_width * scale_factor)
-                        new_height = int(img_height * scale_factor)
-                        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    
-                    img.save(temp_jpg, "JPEG", quality=60, optimize=True)
-                    pdf.image(temp_jpg, x=x, y=y, w=new_w, h=new_h)
-                    
-                    processed_images += 1
-                    
-                    if os.path.exists(temp_jpg):
-                        os.remove(temp_jpg)
-                        
-            except Exception as e:
-                logger.error(f"Rasm xatolik: {e}")
-                continue
+    def user_memory(self, user_id: int) -> int:
+        """Foydalanuvchi havolasidagi xotiradagi fayllar hajmi"""
+        total = 0
+        for key in self._user_keys.get(user_id, ()):
+            blob = self._blobs.get(key)
+            if blob is not None and blob.data is not None:
+                total += blob.size
+        return total
 
-        if processed_images == 0:
-            await update.message.reply_text("❌ Hech qanday rasm qo'shilmadi.")
-            return
+    def release_user(self, user_id: int):
+        """Foydalanuvchining barcha havolalarini qaytarish (fayllar keshda qoladi)"""
+        self._user_touched.pop(user_id, None)
+        for key in self._user_keys.pop(user_id, ()):
+            blob = self._blobs.get(key)
+            if blob is not None:
+                blob.refs.pop(user_id, None)
+        self._evict()
 
-        pdf.output(pdf_path)
-        
-        pdf_size = os.path.getsize(pdf_path)
-        size_info = f"{pdf_size/1024:.0f}KB" if pdf_size < 1024*1024 else f"{pdf_size/(1024*1024):.1f}MB"
-        
-        with open(pdf_path, "rb") as pdf_file:
-            await update.message.reply_document(
-                document=pdf_file,
-                filename="converted.pdf",
-                caption=f"✅ PDF tayyor! {processed_images} ta rasm, Hajmi: {size_info}"
-            )
+    def idle_users(self, deadline: float) -> list:
+        """deadline dan beri yangi havola olmagan foydalanuvchilar"""
+        return [user_id for user_id, touched in self._user_touched.items() if touched < deadline]
+
+    @staticmethod
+    def output_key(kind: str, refs: list) -> str:
+        """Natija kaliti: konvertatsiya turi + kirish fayllari tartibi"""
+        return "out:" + hashlib.sha256(json.dumps([kind, refs]).encode()).hexdigest()
+
+    def get_output(self, key: str):
+        blob = self.get(key)
+        if blob is None:
+            return None
+        self.output_hits += 1
+        return blob.data, blob.meta
+
+    def put_output(self, key: str, data: bytes, meta: dict = None):
+        if len(data) > self.max_bytes // 4:
+            return  # juda katta natijalar keshni siqib chiqarmasin
+        self._add(Blob(key, data=data, meta=meta))
+        self._evict()
+
+    def _add(self, blob: Blob):
+        old = self._blobs.pop(blob.key, None)
+        if old is not None:
+            blob.refs = old.refs
+            self._drop(old, keep_path=blob.path)
+        self._blobs[blob.key] = blob
+        self.size += blob.size
+
+    def _drop(self, blob: Blob, keep_path: str = None):
+        self.size -= blob.size
+        if blob.path and blob.path != keep_path:
+            reaper.discard(blob.path, "blob")
+
+    def shrink_disk(self, needed: int) -> int:
+        """Disk kvotasi uchun havolasiz diskdagi fayllarni (LRU) o'chirish; bo'shagan baytlar"""
+        freed = 0
+        for key in [key for key, blob in self._blobs.items() if blob.path and not blob.refs]:
+            if freed >= needed:
+                break
+            blob = self._blobs.pop(key)
+            freed += blob.size
+            self._drop(blob)
+            self.evictions += 1
+        return freed
+
+    def _evict(self):
+        """Havolasiz eng eski fayllarni chegaradan oshgancha o'chirish"""
+        if self.size <= self.max_bytes:
+            return
+        for key in [key for key, blob in self._blobs.items() if not blob.refs]:
+            self._drop(self._blobs.pop(key))
+            self.evictions += 1
+            if self.size <= self.max_bytes:
+                break
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._blobs),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "output_hits": self.output_hits,
+            "evictions": self.evictions,
+        }
+
+blob_cache = BlobCache()
+
+def input_ref(attachment) -> str:
+    return f"blob:{attachment.file_unique_id}"
+
+async def save_input(user_id: int, attachment) -> str:
+    """Telegram faylini keshga olish va "blob:<file_unique_id>" havolasini qaytarish.
+
+    Keshda bo'lsa getFile ham chaqirilmaydi. Foydalanuvchining xotiradagi
+    fayllari SPILL_THRESHOLD dan oshsa yangi fayl BLOB_DIR ga yoziladi.
+    """
+    key = attachment.file_unique_id
+
+    async def download():
+        started = time.monotonic()
+        file = await attachment.get_file()
+        if blob_cache.user_memory(user_id) + (file.file_size or 0) <= SPILL_THRESHOLD:
+            data, path = bytes(await file.download_as_bytearray()), None
+        else:
+            os.makedirs(blob_cache.directory, exist_ok=True)
+            data, path = None, os.path.join(blob_cache.directory, key)
+            await file.download_to_drive(path)
+        DOWNLOAD_TIME.observe(time.monotonic() - started)
+        return data, path
+
+    await blob_cache.fetch(key, user_id, download)
+    return input_ref(attachment)
+
+def load_input(user_id: int, ref: str):
+    """Havola bo'yicha fayl: xotiradagi bo'lsa bytes, diskdagi bo'lsa yo'l"""
+    return blob_cache.get(ref[5:]).source
+
+def discard_inputs(user_id: int):
+    """Foydalanuvchi havolalarini bo'shatish, fayllar keshda qayta ishlatish uchun qoladi"""
+    conversion_queue.cancel(user_id)
+    prefetcher.cancel(user_id)
+    blob_cache.release_user(user_id)
+
+def release_expired_inputs(user_id: int):
+    """Muddati o'tgan yoki siqib chiqarilgan sessiyaning havolalarini bo'shatish.
+
+    Havolalar odatda discard_inputs (Back, menyu, tugagan ish) bilan qaytadi;
+    fayl yuborib ketib qolgan foydalanuvchining fayllari esa aks holda keshdan
+    hech qachon chiqmaydi.
+    """
+    if user_id in conversion_queue._jobs:
+        return  # ish tugagach cleanup_user_data bo'shatadi
+    prefetcher.cancel(user_id)
+    blob_cache.release_user(user_id)
+
+sessions.on_expire = release_expired_inputs
+
+def input_exists(user_id: int, ref: str) -> bool:
+    return ref.startswith("blob:") and blob_cache.get(ref[5:]) is not None
+
+def input_size(user_id: int, ref: str) -> int:
+    return blob_cache.get(ref[5:]).size
+
+# 📥 Albom rasmlarini kelishi bilan parallel yuklash
+class UserPrefetch:
+    """Bitta foydalanuvchining fondagi yuklashlari va tasdiq xabari"""
+    __slots__ = ("semaphore", "tasks", "ack", "ack_group", "ack_timer", "ack_lock")
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.tasks = set()
+        self.ack = None  # tahrirlanadigan "Rasm saqlandi" xabari
+        self.ack_group = None
+        self.ack_timer = None
+        self.ack_lock = asyncio.Lock()
+
+class InputPrefetcher:
+    """Rasmlar handler'ni kutdirmasdan fonda yuklanadi.
+
+    Foydalanuvchi boshiga `concurrency` tagacha parallel yuklash. Albom (media
+    group) uchun bitta tasdiq xabari yuboriladi va keyingi rasmlarda tahrirlanadi.
+    """
+
+    def __init__(self, concurrency: int = DOWNLOAD_CONCURRENCY, ack_delay: float = ALBUM_ACK_DELAY):
+        self.concurrency = concurrency
+        self.ack_delay = ack_delay
+        self._users = {}
+
+    def submit(self, user_id: int, attachment, message, count: int) -> str:
+        """Yuklashni fonda boshlash va havolani darhol qaytarish"""
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = UserPrefetch(self.concurrency)
         
-        USER_STATE[user_id] = "main"
-        await update.message.reply_text("🏠 Asosiy menyuga qaytdingiz.", reply_markup=main_menu())
+        task = asyncio.create_task(self._download(state, user_id, attachment))
+        state.tasks.add(task)
+        task.add_done_callback(state.tasks.discard)
+        self._schedule_ack(state, message, count)
+        return input_ref(attachment)
 
-    except Exception as e:
-        logger.error(f"PDF xatolik: {e}")
-        await update.message.reply_text(f"❌ PDF yaratishda xatolik: {e}")
-    
-    finally:
-        cleanup_user_data(user_id)
+    async def _download(self, state: UserPrefetch, user_id: int, attachment):
+        async with state.semaphore:
+            try:
+                await save_input(user_id, attachment)
+            except Exception as e:
+                logger.error("Rasm yuklash xatolik: %s", e)
 
-# 🧾 Word → PDF funksiyasi
-async def create_word_pdf(update, context):
+    def _schedule_ack(self, state: UserPrefetch, message, count: int):
+        """Har yangi rasmda taymer qayta boshlanadi; boshqa albom yangi xabar oladi"""
+        if state.ack_timer is not None:
+            state.ack_timer.cancel()
+        group = message.media_group_id
+        if group is None or group != state.ack_group:
+            state.ack = None
+        state.ack_group = group
+        
+        loop = asyncio.get_running_loop()
+        state.ack_timer = loop.call_later(
+            self.ack_delay,
+            lambda: state.tasks.add(loop.create_task(self._send_ack(state, message, count))),
+        )
+
+    async def _send_ack(self, state: UserPrefetch, message, count: int):
+        text = f"🖼 Rasm saqlandi ({count} ta)."
+        async with state.ack_lock:
+            try:
+                if state.ack is None:
+                    state.ack = await message.reply_text(text)
+                else:
+                    await state.ack.edit_text(text)
+            except TelegramError as e:
+                logger.warning("Tasdiq xabari yuborilmadi: %s", e)
+        state.tasks.discard(asyncio.current_task())
+
+    async def wait(self, user_id: int):
+        """Hali tugamagan yuklashlarni kutish (tasdiq xabari endi kerak emas)"""
+        state = self._users.pop(user_id, None)
+        if state is None:
+            return
+        if state.ack_timer is not None:
+            state.ack_timer.cancel()
+        if state.tasks:
+            await asyncio.gather(*state.tasks, return_exceptions=True)
+
+    def cancel(self, user_id: int):
+        state = self._users.pop(user_id, None)
+        if state is None:
+            return
+        if state.ack_timer is not None:
+            state.ack_timer.cancel()
+        for task in state.tasks:
+            task.cancel()
+
+prefetcher = InputPrefetcher()
+
+def as_file(source):
+    """bytes bo'lsa BytesIO, yo'l bo'lsa o'zi (Image.open/Document uchun)"""
+    return io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+
+def format_size(size: int) -> str:
+    return f"{size/1024:.0f}KB" if size < 1024*1024 else f"{size/(1024*1024):.1f}MB"
+
+# 🖼 Rasm yuborilganda
+async def handle_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    word_path = USER_DATA.get(user_id)
+    session = sessions.get(user_id)
+    if session.state != "image":
+        return
+    if session.data is None:
+        session.data = []
+
+    # Yuklash fonda ketadi, handler keyingi rasmni darhol qabul qiladi
+    if update.message.photo:
+        attachment = update.message.photo[-1]
+    elif update.message.document:
+        attachment = update.message.document
+        if not attachment.mime_type.startswith("image/"):
+            await update.message.reply_text("⚠️ Faqat rasm yuboring.")
+            return
+    else:
+        return
+    if not await allow_download(update, attachment):
+        return
     
-    if not word_path or not os.path.exists(word_path):
-        await update.message.reply_text("❌ Avval Word fayl yuklang.")
+    ref = prefetcher.submit(user_id, attachment, update.message, len(session.data) + 1)
+    session.data.append(ref)
+    sessions.save(session)
+
+async def allow_download(update: Update, attachment) -> bool:
+    """Yuklash limiti; keshdagi fayl Telegram'dan qayta yuklanmaydi, shuning uchun bepul"""
+    if blob_cache.get(attachment.file_unique_id) is not None:
+        return True
+    wait = download_limiter.check(update.message.from_user.id)
+    if wait:
+        await reply_rate_limited(update, download_limiter, wait,
+                                 "⏳ Fayllar juda tez kelmoqda. {seconds} soniyadan keyin qayta yuboring.")
+        return False
+    return True
+
+# 📄 Word fayl yuborilganda
+async def handle_word(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.message.from_user.id
+    session = sessions.get(user_id)
+    if session.state != "word":
         return
 
-    pdf_path = word_path.replace(".docx", ".pdf")
+    if not update.message.document:
+        await update.message.reply_text("⚠️ Iltimos, Word fayl yuboring (.docx).")
+        return
+
+    doc = update.message.document
+    if not doc.file_name.endswith(".docx"):
+        await update.message.reply_text("⚠️ Faqat .docx formatdagi faylni yuboring.")
+        return
+
+    if not await allow_download(update, doc):
+        return
+
+    session.data = await save_input(user_id, doc)
+    sessions.save(session)
+    await update.message.reply_text("📄 Word fayl saqlandi. Endi '✅ Create PDF' tugmasini bosing.")
+
+# 📦 Og'ir konvertatsiya kutubxonalari (fpdf, fontTools, PIL, python-docx, lxml)
+# Modul yuklanganda import qilinmaydi: chat/ingress jarayonlari ularsiz tez ishga tushadi.
+_conversion_libs_lock = threading.Lock()
+_conversion_libs_loaded = False
+
+def load_conversion_libs():
+    """Kutubxonalarni bir marta import qilish (thread-safe, qayta chaqirish arzon)"""
+    global _conversion_libs_loaded, FPDF, SubsetMap, ttLib, Image, ImageOps, Document, WD_STYLE_TYPE
+    global element_class_lookup, Table, Paragraph, Run, etree
+    if _conversion_libs_loaded:
+        return
+    with _conversion_libs_lock:
+        if _conversion_libs_loaded:
+            return
+        started = time.perf_counter()
+        from fpdf import FPDF
+        from fpdf.fonts import SubsetMap
+        from fontTools import ttLib
+        from PIL import Image, ImageOps
+        from docx import Document
+        from docx.enum.style import WD_STYLE_TYPE
+        from docx.oxml.parser import element_class_lookup
+        from docx.table import Table
+        from docx.text.paragraph import Paragraph
+        from docx.text.run import Run
+        from lxml import etree
+        _conversion_libs_loaded = True
+        logger.info("📦 Konvertatsiya kutubxonalari yuklandi (%.0f ms)", (time.perf_counter() - started) * 1000)
+
+async def ensure_conversion_libs():
+    """Event loop'ni to'xtatmasdan yuklash (birinchi konvertatsiyada)"""
+    if not _conversion_libs_loaded:
+        await asyncio.to_thread(load_conversion_libs)
+
+async def warm_up_conversions():
+    """Startdan keyin fonda: kutubxonalar va shriftlar birinchi so'rovgacha tayyor bo'lsin"""
+    try:
+        await ensure_conversion_libs()
+        if font_cache.available():
+            await asyncio.to_thread(font_cache.load)
+    except Exception as e:
+        logger.error("Warm-up xatolik: %s", e)
+
+# 🖼 Rasmlarni parallel qayta ishlash (process/thread pool)
+IMAGE_MAX_PIXELS = 1200 * 1200
+PAGE_W, PAGE_H, PAGE_MARGIN = 210, 297, 10
+
+image_executor = None
+
+def get_image_executor():
+    """Rasm workerlari pool'i (birinchi ishlatilganda yaratiladi)"""
+    global image_executor
+    if image_executor is None:
+        if IMAGE_POOL == "thread":
+            # Pillow decode/resize/encode paytida GIL'ni qo'yib yuboradi
+            image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+        else:
+            image_executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return image_executor
+
+def discard_image_executor(broken):
+    """Buzilgan pool'ni tashlash; keyingi get_image_executor() yangisini yaratadi"""
+    global image_executor
+    if image_executor is broken:
+        image_executor = None
+        logger.error("💥 Rasm pool'i buzildi (worker jarayon to'xtadi), yangisi yaratiladi")
+    broken.shutdown(wait=False, cancel_futures=True)
+
+async def render_in_pool(source) -> tuple:
+    """render_image'ni pool'da bajarish.
+
+    Bitta worker jarayon o'lsa (masalan, OOM killer) butun ProcessPoolExecutor
+    buziladi: pool almashtiriladi va rasm bir marta qayta uriniladi. Yana
+    buzilsa faqat shu rasm xatolik bilan tugaydi.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        executor = get_image_executor()
+        try:
+            return await loop.run_in_executor(executor, render_image, source)
+        except BrokenProcessPool:
+            discard_image_executor(executor)
+            if attempt:
+                raise
+
+EXIF_ORIENTATION = 0x0112
+
+def is_passthrough_jpeg(img) -> bool:
+    """Rasm PDF ga o'zgartirishsiz qo'yilishi mumkinmi (faqat header o'qiladi, decode yo'q).
+
+    Shartlar: baseline JPEG, RGB/kulrang, burish kerak emas, IMAGE_MAX_PIXELS dan oshmaydi.
+    """
+    if img.format != "JPEG" or img.mode not in ("RGB", "L"):
+        return False
+    if img.info.get("progressive") or img.info.get("progression"):
+        return False
+    if img.width * img.height > IMAGE_MAX_PIXELS:
+        return False
+    return img.getexif().get(EXIF_ORIENTATION, 1) == 1
+
+def render_image(source, passthrough: bool = True) -> tuple:
+    """Rasmni PDF uchun tayyorlash (worker ichida ishlaydi).
+
+    `source` — rasm baytlari yoki fayl yo'li. Talabga javob beradigan JPEG
+    o'zgarishsiz qaytariladi; qolganlari buriladi, RGB ga o'tkaziladi,
+    kichraytiriladi va qayta kodlanadi. Qaytaradi: (jpeg_bytes, eni, bo'yi)
+    """
+    load_conversion_libs()  # process pool'dagi jarayonda birinchi marta
+    with Image.open(as_file(source)) as img:
+        # Image.open dangasa: bu yergacha faqat header o'qilgan
+        if passthrough and is_passthrough_jpeg(img):
+            if isinstance(source, (bytes, bytearray)):
+                return bytes(source), img.width, img.height
+            with open(source, "rb") as f:
+                return f.read(), img.width, img.height
+        
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img_width, img_height = img.size
+        
+        current_pixels = img_width * img_height
+        if current_pixels > IMAGE_MAX_PIXELS:
+            scale_factor = (IMAGE_MAX_PIXELS / current_pixels) ** 0.5
+            new_width = int(img_width * scale_factor)
+            new_height = int(img_height * scale_factor)
+            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        
+        output = io.BytesIO()
+        img.save(output, "JPEG", quality=60, optimize=True)
+    return output.getvalue(), img_width, img_height
+
+def fit_on_page(img_width: int, img_height: int) -> tuple:
+    """Rasmni A4 sahifaga markazlab joylashtirish: (x, y, w, h) mm da"""
+    available_w = PAGE_W - 2 * PAGE_MARGIN
+    available_h = PAGE_H - 2 * PAGE_MARGIN
+    
+    img_ratio = img_width / img_height
+    available_ratio = available_w / available_h
+    
+    if img_ratio > available_ratio:
+        new_w = available_w
+        new_h = available_w / img_ratio
+    else:
+        new_h = available_h
+        new_w = available_h * img_ratio
+    
+    x = PAGE_MARGIN + (available_w - new_w) / 2
+    y = PAGE_MARGIN + (available_h - new_h) / 2
+    return x, y, new_w, new_h
+
+# 🌊 Oqimli rejim: sahifalar tayyor bo'lishi bilan faylga yoziladi
+class JpegPdfWriter:
+    """Har sahifasida bitta JPEG bo'lgan PDF ni faylga bo'laklab yozish.
+
+    Yozilgan sahifa xotirada qolmaydi: faqat obyektlar offsetlari saqlanadi,
+    sahifalar ro'yxati, xref va trailer oxirida yoziladi. Bir xil rasmlar
+    bir marta yoziladi.
+    """
+    COLOR_SPACES = {"L": b"/DeviceGray", "RGB": b"/DeviceRGB"}
+    SCALE = 72 / 25.4  # mm -> pt
+    CATALOG, PAGES = 1, 2
+
+    def __init__(self, file):
+        self.file = file
+        self.position = 0
+        self.pages = []
+        self._offsets = {}
+        self._images = {}  # sha256 -> rasm obyekti
+        self._next_id = 3
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data: bytes):
+        self.file.write(data)
+        self.position += len(data)
+
+    def _object(self, body: bytes, stream: bytes = None, object_id: int = None) -> int:
+        if object_id is None:
+            object_id = self._next_id
+            self._next_id += 1
+        self._offsets[object_id] = self.position
+        self._write(b"%d 0 obj\n" % object_id + body)
+        if stream is not None:
+            self._write(b"\nstream\n")
+            self._write(stream)
+            self._write(b"\nendstream")
+        self._write(b"\nendobj\n")
+        return object_id
+
+    def add_page(self, jpeg_bytes: bytes, x: float, y: float, w: float, h: float):
+        """JPEG ni qayta kodlamasdan (DCTDecode) A4 sahifaga (mm) joylashtirish"""
+        with Image.open(io.BytesIO(jpeg_bytes)) as img:
+            color_space = self.COLOR_SPACES.get(img.mode)
+            if img.format != "JPEG" or color_space is None:
+                raise ValueError(f"Qo'llab-quvvatlanmaydigan rasm: {img.format} {img.mode}")
+            width, height = img.size
+        
+        k = self.SCALE
+        digest = hashlib.sha256(jpeg_bytes).digest()
+        image_id = self._images.get(digest)
+        if image_id is None:
+            image_id = self._images[digest] = self._object(
+                b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s"
+                b" /BitsPerComponent 8 /Filter /DCTDecode /Length %d >>" % (width, height, color_space, len(jpeg_bytes)),
+                jpeg_bytes,
+            )
+        content = b"q %.2f 0 0 %.2f %.2f %.2f cm /I0 Do Q" % (w * k, h * k, x * k, (PAGE_H - y - h) * k)
+        content_id = self._object(b"<< /Length %d >>" % len(content), content)
+        self.pages.append(self._object(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Resources << /XObject << /I0 %d 0 R >> >>"
+            b" /Contents %d 0 R >>" % (self.PAGES, PAGE_W * k, PAGE_H * k, image_id, content_id)
+        ))
+
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % page for page in self.pages)
+        self._object(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.pages)), object_id=self.PAGES)
+        self._object(b"<< /Type /Catalog /Pages %d 0 R >>" % self.PAGES, object_id=self.CATALOG)
+        
+        xref_at = self.position
+        count = self._next_id
+        entries = [b"0000000000 65535 f \n"]
+        entries += [b"%010d 00000 n \n" % self._offsets[object_id] for object_id in range(1, count)]
+        self._write(b"xref\n0 %d\n" % count + b"".join(entries))
+        self._write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, self.CATALOG, xref_at))
+
+async def write_image_pdf_streaming(sources: list, out, progress=None) -> int:
+    """Rasmlarni tartib bilan render qilib `out` faylga yozish.
+
+    `sources` — (manba, hajm) juftlari. Bir paytda STREAM_MEMORY_BUDGET baytgacha
+    (kamida bitta) rasm ishlanadi. progress(done, total) har sahifadan keyin chaqiriladi.
+    Qaytaradi: qo'shilgan sahifalar soni.
+    """
+    await ensure_conversion_libs()
+    writer = JpegPdfWriter(out)
+    window = max(IMAGE_WORKERS * 2, 1)
+    pending = {}
+    in_flight = 0
+    submitted = 0
+    processed = 0
     
     try:
-        await update.message.reply_text("⏳ PDF yaratilmoqda...")
+        for index in range(len(sources)):
+            # Keyingi rasmlarni byudjet va oyna chegarasigacha ishga tushirish
+            while submitted < len(sources) and submitted - index < window and (
+                submitted == index or in_flight + sources[submitted][1] <= STREAM_MEMORY_BUDGET
+            ):
+                source, size = sources[submitted]
+                pending[submitted] = asyncio.create_task(render_in_pool(source))
+                in_flight += size
+                submitted += 1
+            
+            try:
+                jpeg_bytes, img_width, img_height = await pending.pop(index)
+                await asyncio.to_thread(writer.add_page, jpeg_bytes, *fit_on_page(img_width, img_height))
+                processed += 1
+            except Exception as e:
+                logger.error("Rasm xatolik: %s", e)
+            finally:
+                in_flight -= sources[index][1]
+            
+            if progress is not None:
+                await progress(index + 1, len(sources))
+    finally:
+        for render in pending.values():
+            render.cancel()
+    
+    if processed:
+        await asyncio.to_thread(writer.close)
+    return processed
+
+def return_to_main(user_id: int):
+    """Ish tugagach asosiy menyu holati.
+
+    Sessiya qayta o'qiladi: ish boshida olingan nusxa (SQLite'da alohida obyekt)
+    saqlansa, ish davomida yozilgan o'zgarishlar (masalan, chat tarixi) yo'qoladi.
+    """
+    session = sessions.get(user_id)
+    session.state = "main"
+    sessions.save(session)
+
+async def send_image_pdf(update: Update, document, processed_images: int, size: int = None):
+    """document — PDF baytlari yoki oqimli rejimda vaqtinchalik fayl"""
+    if size is None:
+        size = len(document)
+    await update.message.reply_document(
+        document=document,
+        filename="converted.pdf",
+        caption=f"✅ PDF tayyor! {processed_images} ta rasm, Hajmi: {format_size(size)}"
+    )
+    
+    return_to_main(update.message.from_user.id)
+    await update.message.reply_text("🏠 Asosiy menyuga qaytdingiz.", reply_markup=main_menu())
+
+# 🧾 Image → PDF funksiyasi
+async def create_image_pdf(update: Update, job):
+    user_id = update.message.from_user.id
+    image_files = sessions.get(user_id).data or []
+    jobs = []
+
+    try:
+        await ensure_conversion_libs()
+        # Faqat hali yuklanayotgan rasmlar kutiladi; yuklanmaganlari tashlab ketiladi
+        await prefetcher.wait(user_id)
+        image_files = [ref for ref in image_files if input_exists(user_id, ref)]
+        if not image_files:
+            await update.message.reply_text("❌ Rasmlarni yuklab bo'lmadi.")
+            return
+        
+        # Katta ishlar oqimli rejimda: sahifalar darhol faylga, xotira chegaralangan
+        started = time.monotonic()
+        sizes = [input_size(user_id, ref) for ref in image_files]
+        if sum(sizes) >= STREAM_THRESHOLD:
+            async def progress(done, total):
+                await job.editor.update(f"⏳ PDF yaratilmoqda... {done}/{total}")
+            
+            with tempfile.TemporaryFile() as out:
+                sources = [(load_input(user_id, ref), size) for ref, size in zip(image_files, sizes)]
+                processed_images = await write_image_pdf_streaming(sources, out, progress)
+                if processed_images == 0:
+                    await update.message.reply_text("❌ Hech qanday rasm qo'shilmadi.")
+                    return
+                PDF_PAGE_TIME.observe((time.monotonic() - started) / processed_images, "image", count=processed_images)
+                size = out.tell()
+                out.seek(0)
+                await send_image_pdf(update, out, processed_images, size)
+            return
         
-        document = Document(word_path)
-        pdf = FPDF()
-        pdf.add_page()
+        # Xuddi shu rasmlar shu tartibda avval aylantirilgan bo'lsa, tayyor PDF
+        output_key = BlobCache.output_key("image", image_files)
+        cached = blob_cache.get_output(output_key)
+        if cached is not None:
+            pdf_bytes, meta = cached
+            await send_image_pdf(update, pdf_bytes, meta["images"])
+            return
+        
+        # Barcha rasmlar parallel qayta ishlanadi, event loop bo'sh qoladi
+        jobs = [asyncio.create_task(render_in_pool(load_input(user_id, ref))) for ref in image_files]
+        
+        done = 0
+        for render in asyncio.as_completed(jobs):
+            try:
+                await render
+            except Exception:
+                pass  # xatolik quyida, tartib bilan log qilinadi
+            done += 1
+            await job.editor.update(f"⏳ PDF yaratilmoqda... {done}/{len(jobs)}")
         
+        # Natijalarni asl tartibda yig'ish
+        pdf = FPDF(unit="mm", format="A4")
+        processed_images = 0
+
+        for render in jobs:
+            try:
+                jpeg_bytes, img_width, img_height = render.result()
+                x, y, new_w, new_h = fit_on_page(img_width, img_height)
+                pdf.add_page()
+                pdf.image(io.BytesIO(jpeg_bytes), x=x, y=y, w=new_w, h=new_h)
+                processed_images += 1
+            except Exception as e:
+                logger.error("Rasm xatolik: %s", e)
+                continue
+
+        if processed_images == 0:
+            await update.message.reply_text("❌ Hech qanday rasm qo'shilmadi.")
+            return
+
+        # PDF to'g'ridan-to'g'ri xotirada, diskka yozilmaydi
+        pdf_bytes = bytes(await asyncio.to_thread(pdf.output))
+        PDF_PAGE_TIME.observe((time.monotonic() - started) / processed_images, "image", count=processed_images)
+        if processed_images == len(jobs):
+            blob_cache.put_output(output_key, pdf_bytes, {"images": processed_images})
+        
+        await send_image_pdf(update, pdf_bytes, processed_images)
+
+    except Exception as e:
+        logger.error("PDF xatolik: %s", e)
+        await update.message.reply_text(f"❌ PDF yaratishda xatolik: {e}")
+    
+    finally:
+        # Bekor qilinganda hali boshlanmagan rasmlar pool'da kutib qolmasin
+        for render in jobs:
+            render.cancel()
+
+# 📄 DOCX body'ni bir marta, tartib bilan aylanib chiqish
+WORD_NAMESPACES = {
+    "w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main",
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+}
+
+def qn(tag: str) -> str:
+    """'w:p' -> Clark nomi (docx.oxml.ns.qn bilan bir xil, python-docx'ni import qilmasdan)"""
+    prefix, name = tag.split(":")
+    return f"{{{WORD_NAMESPACES[prefix]}}}{name}"
+
+P_TAG = qn('w:p')
+R_TAG = qn('w:r')
+TBL_TAG = qn('w:tbl')
+BLIP_TAG = qn('a:blip')
+EMBED_ATTR = qn('r:embed')
+
+def iter_run_images(run_element, load_image):
+    """Run ichidagi rasmlar (a:blip) baytlari"""
+    for blip in run_element.iter(BLIP_TAG):
+        embed = blip.get(EMBED_ATTR)
+        image_bytes = load_image(embed) if embed else None
+        if image_bytes is not None:
+            yield image_bytes
+
+def iter_docx_blocks(document):
+    """Body elementlarini hujjat tartibida O(n) da qaytarish.
+
+    Yield qiladi: ("text", Paragraph, [Run, ...]), ("image", bytes) yoki ("table", Table).
+    Paragraf ichidagi inline rasmlar run'lar orasida o'z joyida chiqadi.
+    """
+    related_parts = document.part.related_parts
+
+    def load_image(embed):
+        return related_parts[embed].blob if embed in related_parts else None
+
+    return iter_body_blocks(document.element.body.iterchildren(), document._body, load_image)
+
+def iter_body_blocks(elements, parent, load_image):
+    """iter_docx_blocks asosi: body elementlari oqimidan bloklar"""
+    for element in elements:
+        if element.tag == P_TAG:
+            paragraph = Paragraph(element, parent)
+            runs = []
+            # Hyperlink ichidagi run'lar ham hujjat tartibida keladi
+            for run_element in element.iter(R_TAG):
+                images = list(iter_run_images(run_element, load_image))
+                if images:
+                    if runs:
+                        yield ("text", paragraph, runs)
+                    runs = []
+                    for image_bytes in images:
+                        yield ("image", image_bytes)
+                runs.append(Run(run_element, paragraph))
+            
+            if runs:
+                yield ("text", paragraph, runs)
+        
+        elif element.tag == TBL_TAG:
+            yield ("table", Table(element, parent))
+        
+        elif element.tag == R_TAG:
+            for image_bytes in iter_run_images(element, load_image):
+                yield ("image", image_bytes)
+
+# 🌊 Katta DOCX: body'ni to'liq daraxtga yuklamasdan oqim bilan o'qish
+DOCUMENT_XML = "word/document.xml"
+BODY_TAG = qn('w:body')
+XML_CHUNK = 64 * 1024
+
+def docx_skeleton(archive: zipfile.ZipFile):
+    """Body'siz va rasmlarsiz DOCX: faqat uslublar, raqamlash va havolalar uchun"""
+    head = b""
+    with archive.open(DOCUMENT_XML) as stream:
+        while b"<w:body" not in head:
+            chunk = stream.read(XML_CHUNK)
+            if not chunk:
+                raise ValueError("document.xml da w:body topilmadi")
+            head += chunk
+    stub = head[:head.index(b"<w:body")] + b"<w:body/></w:document>"
+    
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as skeleton:
+        for name in archive.namelist():
+            if name == DOCUMENT_XML:
+                skeleton.writestr(name, stub)
+            elif name.endswith((".xml", ".rels")):
+                skeleton.writestr(name, archive.read(name))
+            else:
+                skeleton.writestr(name, b"")  # rasmlar kerak bo'lganda arxivdan o'qiladi
+    buffer.seek(0)
+    return Document(buffer)
+
+def iter_body_elements(archive: zipfile.ZipFile):
+    """document.xml dan body bolalarini bittalab; ishlangani xotiradan o'chiriladi"""
+    parser = etree.XMLPullParser(events=("end",), remove_blank_text=True, resolve_entities=False, huge_tree=True)
+    parser.set_element_class_lookup(element_class_lookup)
+    with archive.open(DOCUMENT_XML) as stream:
+        while True:
+            chunk = stream.read(XML_CHUNK)
+            if chunk:
+                parser.feed(chunk)
+            else:
+                parser.close()
+            for _, element in parser.read_events():
+                body = element.getparent()
+                if body is None or body.tag != BODY_TAG:
+                    continue
+                yield element
+                element.clear()
+                while element.getprevious() is not None:
+                    del body[0]
+            if not chunk:
+                break
+
+def iter_docx_blocks_streaming(archive: zipfile.ZipFile, skeleton):
+    """iter_docx_blocks kabi, lekin body va rasmlar arxivdan kerak bo'lganda o'qiladi"""
+    rels = skeleton.part.rels
+
+    def load_image(embed):
+        rel = rels.get(embed)
+        if rel is None or rel.is_external:
+            return None
+        return archive.read(rel.target_part.partname.lstrip("/"))
+
+    return iter_body_blocks(iter_body_elements(archive), skeleton._body, load_image)
+
+# 🎨 Word → PDF layout: sarlavhalar, qalin/kursiv, ro'yxatlar va jadvallar
+FONT_FAMILY = 'DejaVu'
+FONT_FILES = {
+    '': os.path.join(FONT_DIR, 'DejaVuSans.ttf'),
+    'B': os.path.join(FONT_DIR, 'DejaVuSans-Bold.ttf'),
+    'I': os.path.join(FONT_DIR, 'DejaVuSans-Oblique.ttf'),
+    'BI': os.path.join(FONT_DIR, 'DejaVuSans-BoldOblique.ttf'),
+}
+BODY_FONT_SIZE = 12
+HEADING_FONT_SIZES = {0: 20, 1: 18, 2: 16, 3: 14}  # 0 = Title
+LIST_INDENT = 7  # mm, har bir daraja uchun
+
+ParagraphFormat = namedtuple("ParagraphFormat", "heading bold italic numbering")
+
+class FontCache:
+    """TTF shriftlar jarayon boshida bir marta parse qilinadi va barcha FPDF'larga ulashiladi.
+
+    fpdf2 har bir add_font'da butun TTF ni o'qib, glif enlarini hisoblaydi. Bu
+    yerda o'sha natija (en jadvali, cmap, deskriptor) qayta ishlatiladi; har
+    bir hujjat faqat o'z subset xaritasi va dangasa ochilgan TTFont nusxasini
+    oladi, shuning uchun chiqishdagi subset faqat shu hujjat gliflaridan iborat.
+    """
+
+    def __init__(self, family: str = FONT_FAMILY, files: dict = FONT_FILES):
+        self.family = family
+        self.files = files
+        self._prototypes = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def available(self) -> bool:
+        """Asosiy (Unicode) shrift fayli bormi — parse qilmasdan"""
+        return os.path.exists(self.files[''])
+
+    def check(self):
+        if not self.available():
+            raise FileNotFoundError(self.files[''])
+
+    def load(self):
+        """Shriftlarni parse qilish; asosiy (Unicode) shrift bo'lmasa FileNotFoundError"""
+        with self._lock:
+            if self.loaded:
+                return
+            self.check()
+            load_conversion_libs()
+            
+            template = FPDF()
+            parsed = {}
+            for style in ('', 'B', 'I', 'BI'):
+                # Qalin/kursiv fayl bo'lmasa oddiy shrift bilan (krill saqlanadi)
+                path = self.files[style] if os.path.exists(self.files[style]) else self.files['']
+                if path not in parsed:
+                    with open(path, 'rb') as f:
+                        parsed[path] = f.read()
+                template.add_font(self.family, style, path)
+                self._prototypes[style] = (template.fonts[f"{self.family.lower()}{style}"], parsed[path])
+            self.loaded = True
+            logger.info("🔤 Shriftlar yuklandi: %s", ", ".join(sorted(parsed)))
+
+    def attach(self, pdf: "FPDF") -> str:
+        """Keshdagi shriftlarni FPDF ga ulash; ishlatiladigan oila nomini qaytaradi"""
         try:
-            pdf.add_font('DejaVu', '', 'DejaVuSans.ttf', uni=True)
-            pdf.set_font('DejaVu', '', 12)
-        except:
-            pdf.set_font('Arial', '', 12)
+            self.load()
+        except Exception:
             logger.warning("DejaVu font topilmadi")
+            return 'Arial'
+        
+        identities = "\x00 \r\n"
+        if pdf.str_alias_nb_pages:
+            identities += "0123456789" + pdf.str_alias_nb_pages
+        
+        for style, (prototype, font_bytes) in self._prototypes.items():
+            font = copy.copy(prototype)
+            font.i = len(pdf.fonts) + 1
+            # Subset chiqishda TTFont'ni o'zgartiradi: har bir hujjatga o'z nusxasi
+            font.ttfont = ttLib.TTFont(io.BytesIO(font_bytes), recalcTimestamp=False, fontNumber=0, lazy=True)
+            font.hbfont = None
+            font.desc = copy.copy(prototype.desc)
+            font.missing_glyphs = []
+            font.subset = SubsetMap(font, [ord(char) for char in identities])
+            pdf.fonts[font.fontkey] = font
+        return self.family
+
+font_cache = FontCache()
+WORD_PDF_DISABLED = "⚠️ Word → PDF hozircha ishlamayapti (serverda shrift o'rnatilmagan). Image → PDF va chat ishlaydi."
+
+class StyleResolver:
+    """Hujjat uslublarini (merosi bilan) bir marta hal qilib keshlash"""
+
+    def __init__(self, document):
+        self.document = document
+        # Uslublar jadvali bir marta o'qiladi
+        self._styles = {style.style_id: style for style in document.styles}
+        self._default_paragraph_style = document.styles.default(WD_STYLE_TYPE.PARAGRAPH)
+        self._paragraph_formats = {}
+        self._character_formats = {}
+        self._numbering_formats = {}
+        self._numbering = None
 
-        has_content = False
+    @staticmethod
+    def _chain(style):
+        while style is not None:
+            yield style
+            style = style.base_style
+
+    def paragraph_format(self, paragraph) -> ParagraphFormat:
+        style_id = paragraph._p.style
+        cached = self._paragraph_formats.get(style_id)
+        if cached is None:
+            heading = bold = italic = numbering = None
+            style = self._styles.get(style_id) if style_id else self._default_paragraph_style
+            for item in self._chain(style):
+                name = item.name or ""
+                if heading is None:
+                    if name == "Title":
+                        heading = 0
+                    elif name.startswith("Heading ") and name[8:].isdigit():
+                        heading = int(name[8:])
+                if bold is None:
+                    bold = item.font.bold
+                if italic is None:
+                    italic = item.font.italic
+                if numbering is None:
+                    ppr = item.element.pPr
+                    if ppr is not None and ppr.numPr is not None and ppr.numPr.numId is not None:
+                        ilvl = ppr.numPr.ilvl.val if ppr.numPr.ilvl is not None else 0
+                        numbering = (ppr.numPr.numId.val, ilvl)
+            cached = ParagraphFormat(heading, bool(bold), bool(italic), numbering)
+            self._paragraph_formats[style_id] = cached
         
-        for element in document.element.body:
-            if element.tag == qn('w:p'):
-                para = None
-                for p in document.paragraphs:
-                    if p._element == element:
-                        para = p
-                        break
-                
-                if para:
-                    text = para.text.strip()
-                    if text:
-                        has_content = True
-                        if pdf.get_y() > 270:
-                            pdf.add_page()
-                        
-                        try:
-                            pdf.multi_cell(0, 8, text)
-                            pdf.ln(2)
-                        except Exception as e:
-                            logger.error(f"Matn xatolik: {e}")
-                            safe_text = text.encode('ascii', 'ignore').decode('ascii')
-                            if safe_text:
-                                pdf.multi_cell(0, 8, safe_text)
-                                pdf.ln(2)
+        # To'g'ridan-to'g'ri paragrafga qo'yilgan raqamlash uslubdan ustun
+        ppr = paragraph._p.pPr
+        if ppr is not None and ppr.numPr is not None and ppr.numPr.numId is not None:
+            ilvl = ppr.numPr.ilvl.val if ppr.numPr.ilvl is not None else 0
+            return cached._replace(numbering=(ppr.numPr.numId.val, ilvl))
+        return cached
+
+    def run_style(self, run, paragraph_format: ParagraphFormat) -> str:
+        """Run uchun FPDF shrift uslubi: '', 'B', 'I' yoki 'BI'"""
+        style_id = run._r.style
+        character = self._character_formats.get(style_id)
+        if character is None:
+            bold = italic = None
+            for item in self._chain(self._styles.get(style_id)):
+                if bold is None:
+                    bold = item.font.bold
+                if italic is None:
+                    italic = item.font.italic
+            character = self._character_formats[style_id] = (bold, italic)
+        
+        bold = run.bold
+        if bold is None:
+            bold = character[0] if character[0] is not None else paragraph_format.bold
+        italic = run.italic
+        if italic is None:
+            italic = character[1] if character[1] is not None else paragraph_format.italic
+        return ('B' if bold else '') + ('I' if italic else '')
+
+    def numbering_format(self, num_id: int, ilvl: int) -> str:
+        """numbering.xml dan daraja formati (bullet, decimal, ...)"""
+        key = (num_id, ilvl)
+        if key not in self._numbering_formats:
+            number_format = "bullet"
+            try:
+                if self._numbering is None:
+                    self._numbering = self.document.part.numbering_part.element
+                num = self._numbering.num_having_numId(num_id)
+                abstract_id = num.abstractNumId.val
+                formats = self._numbering.xpath(
+                    f'./w:abstractNum[@w:abstractNumId="{abstract_id}"]/w:lvl[@w:ilvl="{ilvl}"]/w:numFmt/@w:val'
+                )
+                if formats:
+                    number_format = formats[0]
+            except Exception:
+                pass
+            self._numbering_formats[key] = number_format
+        return self._numbering_formats[key]
+
+class WordLayout:
+    """Blok oqimini (iter_docx_blocks) PDF sahifalariga joylashtirish"""
+
+    def __init__(self, pdf: "FPDF", document, family: str, max_image_pixels: int = None):
+        self.pdf = pdf
+        self.family = family
+        self.max_image_pixels = max_image_pixels
+        self.styles = StyleResolver(document)
+        self._widths = {}
+        self._list_counters = {}
+        self.has_content = False
+
+    def text_width(self, text: str, style: str = '', size: int = BODY_FONT_SIZE) -> float:
+        """Matn eni (mm), shrift o'lchamlari keshlangan"""
+        key = (text, style, size)
+        width = self._widths.get(key)
+        if width is None:
+            self.pdf.set_font(self.family, style, size)
+            width = self._widths[key] = self.pdf.get_string_width(text)
+        return width
+
+    def _list_marker(self, num_id: int, ilvl: int) -> str:
+        number_format = self.styles.numbering_format(num_id, ilvl)
+        if number_format in ("bullet", "none"):
+            return "•" if self.family == FONT_FAMILY else "-"
+        
+        counters = self._list_counters.setdefault(num_id, {})
+        counters[ilvl] = counters.get(ilvl, 0) + 1
+        # Yuqori daraja o'zgarsa, ichki darajalar qaytadan boshlanadi
+        for deeper in [level for level in counters if level > ilvl]:
+            del counters[deeper]
+        if number_format in ("lowerLetter", "upperLetter"):
+            letter = chr(ord('a') + (counters[ilvl] - 1) % 26)
+            return (letter.upper() if number_format == "upperLetter" else letter) + ")"
+        return f"{counters[ilvl]}."
+
+    def paragraph(self, paragraph, runs: list):
+        pieces = [(run.text, run) for run in runs]
+        if not "".join(text for text, _ in pieces).strip():
+            return
+        
+        pdf = self.pdf
+        paragraph_format = self.styles.paragraph_format(paragraph)
+        size = HEADING_FONT_SIZES.get(paragraph_format.heading, 13) if paragraph_format.heading is not None else BODY_FONT_SIZE
+        line_height = size * 2 / 3
+        
+        if paragraph_format.heading is not None:
+            pdf.ln(2)
+        
+        left_margin = pdf.l_margin
+        pdf.set_x(left_margin)
+        if paragraph_format.numbering is not None:
+            num_id, ilvl = paragraph_format.numbering
+            indent = LIST_INDENT * (ilvl + 1)
+            marker = self._list_marker(num_id, ilvl)
+            pdf.set_font(self.family, '', size)
+            pdf.set_x(left_margin + indent - LIST_INDENT)
+            pdf.cell(LIST_INDENT, line_height, marker)
+            pdf.set_left_margin(left_margin + indent)
+        
+        try:
+            # Birinchi/oxirgi run'dagi chetki bo'shliqlarni olib tashlash
+            pieces[0] = (pieces[0][0].lstrip(), pieces[0][1])
+            pieces[-1] = (pieces[-1][0].rstrip(), pieces[-1][1])
+            for text, run in pieces:
+                if not text:
+                    continue
+                style = self.styles.run_style(run, paragraph_format)
+                if paragraph_format.heading is not None:
+                    style = 'B' + style.replace('B', '')
+                pdf.set_font(self.family, style, size)
+                try:
+                    pdf.write(line_height, text)
+                except Exception as e:
+                    logger.error("Matn xatolik: %s", e)
+                    safe_text = text.encode('ascii', 'ignore').decode('ascii')
+                    if safe_text:
+                        pdf.write(line_height, safe_text)
+            pdf.ln(line_height)
+            pdf.ln(2)
+            self.has_content = True
+        finally:
+            pdf.set_left_margin(left_margin)
+
+    def image(self, image_bytes: bytes):
+        pdf = self.pdf
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            if self.max_image_pixels and img.width * img.height > self.max_image_pixels:
+                # Oqimli rejim: PDF ichida to'liq o'lchamli rasmlar to'planib qolmasin
+                img.draft('RGB', (img.width // 2, img.height // 2))
+                scale = (self.max_image_pixels / (img.width * img.height)) ** 0.5
+                img = img.resize((max(int(img.width * scale), 1), max(int(img.height * scale), 1)))
+            img = img.convert('RGB')
             
-            elif element.tag == qn('w:r'):
-                for drawing in element.findall('.//'+qn('a:blip')):
-                    try:
-                        embed = drawing.get(qn('r:embed'))
-                        if embed:
-                            image_part = document.part.related_parts[embed]
-                            image_bytes = image_part.blob
-                            
-                            temp_img = f"data/{user_id}/temp_word_img.jpg"
-                            
-                            with Image.open(io.BytesIO(image_bytes)) as img:
-                                img = img.convert('RGB')
-                                
-                                img_w, img_h = img.size
-                                max_w = 180
-                                max_h = 240
-                                
-                                ratio = min(max_w / img_w, max_h / img_h) * 25.4
-                                new_w = img_w * ratio / 25.4
-                                new_h = img_h * ratio / 25.4
-                                
-                                img.save(temp_img, 'JPEG', quality=85)
-                                
-                                if pdf.get_y() + new_h > 280:
-                                    pdf.add_page()
-                                
-                                pdf.image(temp_img, x=15, w=new_w)
-                                pdf.ln(5)
-                                
-                                if os.path.exists(temp_img):
-                                    os.remove(temp_img)
-                                
-                                has_content = True
-                    except Exception as e:
-                        logger.error(f"Rasm xatolik: {e}")
-                        continue
-
-        if not has_content:
-            pdf.multi_cell(0, 10, "Faylda matn yoki rasm topilmadi.")
-
-        pdf.output(pdf_path)
-        
-        with open(pdf_path, "rb") as pdf_file:
-            await update.message.reply_document(
-                document=pdf_file,
-                filename="converted.pdf",
-                caption="✅ Word fayl PDF ga aylantirildi! (Matn + Rasmlar)"
-            )
+            img_w, img_h = img.size
+            max_w = 180
+            max_h = 240
+            
+            ratio = min(max_w / img_w, max_h / img_h) * 25.4
+            new_w = img_w * ratio / 25.4
+            new_h = img_h * ratio / 25.4
+            
+            jpeg_buffer = io.BytesIO()
+            img.save(jpeg_buffer, 'JPEG', quality=85)
+        
+        if pdf.get_y() + new_h > pdf.page_break_trigger:
+            pdf.add_page()
+        
+        pdf.image(jpeg_buffer, x=15, w=new_w)
+        pdf.ln(5)
+        self.has_content = True
+
+    def table(self, table):
+        pdf = self.pdf
+        rows = []
+        previous_tcs = []
+        for row in table.rows:
+            cells = []
+            row_tcs = []
+            for index, cell in enumerate(row.cells):
+                tc = cell._tc
+                row_tcs.append(tc)
+                if cells and cells[-1][0] is tc:
+                    # Gorizontal birlashtirilgan katak
+                    cells[-1][2] += 1
+                    continue
+                # Vertikal birlashtirilgan davomi bo'sh ko'rsatiladi
+                above = previous_tcs[index] if index < len(previous_tcs) else None
+                text = "" if above is tc else cell.text.strip()
+                cells.append([tc, text, 1])
+            previous_tcs = row_tcs
+            rows.append([(text, colspan) for _, text, colspan in cells])
+        
+        columns = max((sum(colspan for _, colspan in row) for row in rows), default=0)
+        if columns == 0:
+            return
+        
+        # Ustun enlari matn eniga qarab (keshlangan o'lchamlar bilan)
+        widths = [10.0] * columns
+        for row in rows:
+            column = 0
+            for text, colspan in row:
+                if colspan == 1:
+                    longest = max((self.text_width(line) for line in text.splitlines()), default=0)
+                    widths[column] = max(widths[column], min(longest + 4, 80))
+                column += colspan
+        
+        pdf.set_font(self.family, '', BODY_FONT_SIZE - 1)
+        try:
+            with pdf.table(col_widths=widths, text_align="LEFT", first_row_as_headings=False,
+                           line_height=6) as pdf_table:
+                for row in rows:
+                    pdf_row = pdf_table.row()
+                    used = 0
+                    for text, colspan in row:
+                        pdf_row.cell(text, colspan=colspan)
+                        used += colspan
+                    for _ in range(columns - used):
+                        pdf_row.cell("")
+        except Exception as e:
+            logger.error("Jadval xatolik: %s", e)
+        pdf.ln(3)
+        self.has_content = True
+
+def build_word_pdf(source, progress=None) -> bytes:
+    """DOCX (baytlar yoki yo'l) dan PDF baytlari.
+
+    progress(page) har blokdan keyin chaqiriladi; istisno ko'tarsa konvertatsiya to'xtaydi.
+    """
+    load_conversion_libs()
+    document = Document(as_file(source))
+    pdf, family = new_word_pdf()
+    layout = WordLayout(pdf, document, family)
+    layout_word_blocks(layout, iter_docx_blocks(document), progress)
+    return bytes(pdf.output())
+
+def build_word_pdf_streaming(source, out, progress=None):
+    """Katta DOCX uchun: body oqim bilan o'qiladi, rasmlar kichraytiriladi, PDF `out` ga yoziladi"""
+    load_conversion_libs()
+    with zipfile.ZipFile(as_file(source)) as archive:
+        skeleton = docx_skeleton(archive)
+        pdf, family = new_word_pdf()
+        layout = WordLayout(pdf, skeleton, family, max_image_pixels=IMAGE_MAX_PIXELS)
+        layout_word_blocks(layout, iter_docx_blocks_streaming(archive, skeleton), progress)
+    pdf.output(out)
+
+def new_word_pdf():
+    pdf = FPDF()
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_page()
+    family = font_cache.attach(pdf)
+    pdf.set_font(family, '', BODY_FONT_SIZE)
+    return pdf, family
+
+def layout_word_blocks(layout: WordLayout, blocks, progress=None):
+    pdf = layout.pdf
+    for block in blocks:
+        kind = block[0]
+        try:
+            if kind == "text":
+                layout.paragraph(block[1], block[2])
+            elif kind == "image":
+                layout.image(block[1])
+            elif kind == "table":
+                layout.table(block[1])
+        except Exception as e:
+            logger.error("%s xatolik: %s", "Rasm" if kind == "image" else "Blok", e)
+            continue
+        if progress is not None:
+            progress(pdf.page)
+
+    if not layout.has_content:
+        pdf.set_font(layout.family, '', BODY_FONT_SIZE)
+        pdf.multi_cell(0, 10, "Faylda matn yoki rasm topilmadi.")
+
+# 🧾 Word → PDF funksiyasi
+async def create_word_pdf(update, job):
+    user_id = update.message.from_user.id
+    word_ref = sessions.get(user_id).data
+
+    def progress(page: int):
+        # Thread ichida: "🔙 Back" bosilgan bo'lsa keyingi blokda to'xtash
+        if job.cancel_event.is_set():
+            raise JobCancelled()
+        job.pages = page
+
+    # Katta fayllar oqimli rejimda, natija vaqtinchalik faylga yoziladi
+    streaming = input_size(user_id, word_ref) >= STREAM_THRESHOLD
+    out = tempfile.TemporaryFile() if streaming else None
+
+    try:
+        # Xuddi shu fayl avval aylantirilgan bo'lsa keshdan, aks holda event loop'dan tashqarida
+        output_key = BlobCache.output_key("word", [word_ref])
+        cached = None if streaming else blob_cache.get_output(output_key)
+        if cached is not None:
+            pdf_document = cached[0]
+        else:
+            source = load_input(user_id, word_ref)
+            started = time.monotonic()
+            if streaming:
+                convert = asyncio.to_thread(build_word_pdf_streaming, source, out, progress)
+            else:
+                convert = asyncio.to_thread(build_word_pdf, source, progress)
+            build = asyncio.ensure_future(convert)
+            # Bekor qilinsa natija (JobCancelled) hech kim kutmaydi
+            build.add_done_callback(lambda future: future.cancelled() or future.exception())
+            while not build.done():
+                await asyncio.wait({build}, timeout=job.editor.interval)
+                if job.pages:
+                    await job.editor.update(f"⏳ PDF yaratilmoqda... {job.pages}-sahifa")
+            pdf_document = build.result()
+            pages = max(job.pages, 1)
+            PDF_PAGE_TIME.observe((time.monotonic() - started) / pages, "word", count=pages)
+            if streaming:
+                out.seek(0)
+                pdf_document = out
+            else:
+                blob_cache.put_output(output_key, pdf_document)
+        
+        await update.message.reply_document(
+            document=pdf_document,
+            filename="converted.pdf",
+            caption="✅ Word fayl PDF ga aylantirildi! (Matn + Rasmlar)"
+        )
         
-        USER_STATE[user_id] = "main"
+        return_to_main(user_id)
         await update.message.reply_text("🏠 Asosiy menyuga qaytdingiz.", reply_markup=main_menu())
 
     except Exception as e:
-        logger.error(f"Word PDF xatolik: {e}")
+        logger.error("Word PDF xatolik: %s", e)
         await update.message.reply_text(f"❌ Xatolik: {str(e)}")
     
     finally:
-        cleanup_user_data(user_id)
+        if out is not None:
+            out.close()
 
 # 🗑️ Fayllarni tozalash
 def cleanup_user_data(user_id):
-    """Foydalanuvchi fayllarini o'chirish"""
+    """Foydalanuvchi fayllarini o'chirish (xotiradagi va diskdagi)"""
     try:
-        user_dir = f"data/{user_id}"
-        if os.path.exists(user_dir):
-            shutil.rmtree(user_dir)
-        USER_DATA.pop(user_id, None)
+        discard_inputs(user_id)
+        # Papka faqat .trash ga ko'chiriladi, o'chirishni fon reaper bajaradi
+        reaper.discard(os.path.join(DATA_DIR, str(user_id)), "user")
+        session = sessions.get(user_id)
+        session.data = None
+        sessions.save(session)
     except Exception as e:
-        logger.error(f"Tozalash xatolik: {e}")
+        logger.error("Tozalash xatolik: %s", e)
+
+# 🧹 Disk reaper: fon thread'ida partiyalab o'chirish, TTL, kvota va yetim fayllar
+def path_size(path: str) -> int:
+    """Fayl yoki papkaning diskdagi hajmi (symlinklarga ergashmasdan)"""
+    try:
+        if not os.path.isdir(path) or os.path.islink(path):
+            return os.lstat(path).st_size
+    except OSError:
+        return 0
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:
+                pass
+    return total
+
+class DiskReaper:
+    """data/ papkasini event loop'ni to'xtatmasdan tozalash.
+
+    discard() yo'lni darhol .trash ga ko'chiradi (rename — arzon va atomar),
+    haqiqiy o'chirish esa fon thread'ida partiyalab bajariladi. Har
+    CLEANUP_INTERVAL da avval DATA_TTL dan beri faol bo'lmagan foydalanuvchilarning
+    blob havolalari bo'shatiladi (fayl yuborib ketib qolganlar), keyin data/
+    skanerlanadi: DATA_TTL dan eski data/{user_id}/ papkalar (eski versiyalardan),
+    blob keshi bilmaydigan (masalan, qayta ishga tushishdan qolgan) fayllar va
+    DATA_QUOTA_BYTES dan oshgan qism (havolasiz bloblar, LRU) o'chiriladi.
+    Ko'p jarayonli rejimda har bir worker faqat o'z foydalanuvchilarini tozalaydi
+    va kvotaning 1/WORKER_PROCESSES ulushini faqat o'z fayllari (o'z BLOB_DIR
+    va data/{user_id}/ papkalari) bo'yicha hisoblaydi.
+    """
+
+    def __init__(self, root: str = DATA_DIR, interval: float = CLEANUP_INTERVAL, ttl: float = DATA_TTL,
+                 quota: int = DATA_QUOTA_BYTES, batch: int = CLEANUP_BATCH):
+        self.root = root
+        self.trash = os.path.join(root, ".trash")
+        self.interval = interval
+        self.ttl = ttl
+        # Har bir worker faqat o'z fayllarini o'chira oladi: kvota ham teng ulushlarda
+        self.quota = quota // WORKER_PROCESSES if WORKER_INDEX is not None else quota
+        self.batch = batch
+        self._doomed = []  # .trash ga ko'chirib bo'lmagan yo'llar (boshqa disk)
+        self._wake = asyncio.Event()
+        self._ring = None
+        self.pending = 0
+        self.usage = 0
+        self.passes = 0
+        self.reclaimed_bytes = 0
+        self.released_users = 0
+        self.reaped = dict.fromkeys(("user", "blob", "ttl", "orphan", "quota"), 0)
+
+    def discard(self, path: str, reason: str):
+        """Fayl yoki papkani o'chirishga navbatlash"""
+        if not os.path.lexists(path):
+            return
+        try:
+            os.makedirs(self.trash, exist_ok=True)
+            os.rename(path, os.path.join(self.trash, f"{time.time_ns()}-{os.path.basename(path)}"))
+        except OSError:
+            # Boshqa diskda (masalan, BLOB_DIR tashqarida): yonidagi nomga, yo'l qayta ishlatilsa ham xavfsiz
+            doomed = f"{path}.deleted-{time.time_ns()}"
+            try:
+                os.rename(path, doomed)
+            except OSError:
+                doomed = path
+            self._doomed.append(doomed)
+        self.reaped[reason] += 1
+        DISK_REAPED.inc(reason)
+        self.pending += 1
+        if self.pending >= self.batch:
+            self._wake.set()
+
+    def owns(self, user_id: int) -> bool:
+        if WORKER_INDEX is None:
+            return True
+        if self._ring is None:
+            self._ring = HashRing(WORKER_PROCESSES)
+        return self._ring.node(user_id) == int(WORKER_INDEX)
+
+    def release_idle(self) -> int:
+        """Event loop: DATA_TTL dan beri na fayl, na xabar yuborgan foydalanuvchilar havolalari.
+
+        Sessiya hali tirik bo'lsa (SESSION_TTL uzunroq) undagi havolalar ham
+        unutiladi: fayllar endi kvota va LRU bilan o'chirilishi mumkin.
+        """
+        deadline = time.time() - self.ttl
+        released = 0
+        for user_id in blob_cache.idle_users(deadline):
+            if user_id in conversion_queue._jobs:
+                continue
+            last_seen = sessions.last_seen(user_id)
+            if last_seen is not None and last_seen >= deadline:
+                continue
+            sessions.clear_data(user_id)
+            release_expired_inputs(user_id)
+            released += 1
+        if released:
+            self.released_users += released
+            logger.info("🧹 %d ta faol bo'lmagan foydalanuvchi fayllari bo'shatildi", released)
+        return released
+
+    def _scan(self, blob_dir: str) -> tuple:
+        """Thread: data/ hajmi, data/{user_id}/ papkalar va blob fayllar"""
+        usage, user_dirs, blob_files = 0, [], []
+        if os.path.isdir(self.root):
+            for entry in os.scandir(self.root):
+                if entry.path == self.trash:
+                    continue
+                size = path_size(entry.path)
+                usage += size
+                if entry.name.isdigit() and entry.is_dir(follow_symlinks=False):
+                    user_dirs.append((entry.stat().st_mtime, entry.path, size, int(entry.name)))
+        if os.path.isdir(blob_dir):
+            for entry in os.scandir(blob_dir):
+                if entry.is_file(follow_symlinks=False) and ".deleted-" not in entry.name:
+                    stat = entry.stat()
+                    blob_files.append((stat.st_mtime, entry.path, stat.st_size, entry.name))
+        return usage, user_dirs, blob_files
+
+    def _select(self, usage: int, user_dirs: list, blob_files: list):
+        """Event loop: skan natijasidan nimani o'chirishni tanlash (kesh holati shu yerda aniq)"""
+        now = time.time()
+        if WORKER_INDEX is not None:
+            # Boshqa workerlarning bloblari va papkalari bu worker ulushiga kirmaydi
+            usage = (sum(size for _, _, size, user_id in user_dirs if self.owns(user_id))
+                     + sum(size for _, _, size, _ in blob_files))
+        active = set(conversion_queue._jobs) | set(blob_cache._user_keys) | set(prefetcher._users)
+        kept = []
+        for mtime, path, size, user_id in user_dirs:
+            if user_id in active or not self.owns(user_id):
+                continue
+            if now - mtime > self.ttl:
+                self.discard(path, "ttl")
+                usage -= size
+            else:
+                kept.append((mtime, path, size))
+        
+        for _, path, size, key in blob_files:
+            # Keshda yoki hozir yuklanayotgan fayllar yetim emas
+            if key in blob_cache._blobs or key in blob_cache._pending:
+                continue
+            self.discard(path, "orphan")
+            usage -= size
+        
+        if self.quota and usage > self.quota:
+            usage -= blob_cache.shrink_disk(usage - self.quota)
+            for _, path, size in sorted(kept):
+                if usage <= self.quota:
+                    break
+                self.discard(path, "quota")
+                usage -= size
+            if usage > self.quota:
+                logger.warning("💾 data/ kvotadan oshgan: %s / %s (qolganlari ishlatilmoqda)",
+                               format_size(usage), format_size(self.quota))
+        self.usage = usage
+
+    def _purge(self, doomed: list) -> int:
+        """Thread: .trash va qolgan yo'llarni o'chirish; bo'shagan baytlar"""
+        paths = list(doomed)
+        if os.path.isdir(self.trash):
+            paths += [entry.path for entry in os.scandir(self.trash)]
+        freed = 0
+        for path in paths:
+            freed += path_size(path)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return freed
+
+    async def run(self):
+        """Fon vazifasi: birinchi o'tish darhol (qayta ishga tushishdan qolgan fayllar)"""
+        full_pass = True
+        while True:
+            try:
+                if full_pass:
+                    self.release_idle()
+                    self._select(*await asyncio.to_thread(self._scan, blob_cache.directory))
+                    self.passes += 1
+                doomed, self._doomed = self._doomed, []
+                self.pending = 0
+                freed = await asyncio.to_thread(self._purge, doomed)
+                if freed:
+                    self.reclaimed_bytes += freed
+                    DISK_RECLAIMED.inc(amount=freed)
+                    logger.info("🧹 Disk: %s bo'shatildi", format_size(freed))
+            except Exception as e:
+                logger.error("Disk tozalash xatolik: %s", e)
+            
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+                full_pass = False  # partiya to'ldi: faqat o'chirish
+            except asyncio.TimeoutError:
+                full_pass = True
+            self._wake.clear()
+
+    def stats(self) -> dict:
+        return {
+            "usage_bytes": self.usage,
+            "quota_bytes": self.quota,
+            "pending": self.pending,
+            "passes": self.passes,
+            "reclaimed_bytes": self.reclaimed_bytes,
+            "released_users": self.released_users,
+            "reaped": dict(self.reaped),
+        }
+
+reaper = DiskReaper()
+
+# 🧵 Konvertatsiya navbati (cheklangan parallel, adolatli, bekor qilinadigan)
+class JobCancelled(Exception):
+    """Thread ichidagi konvertatsiyani to'xtatish uchun"""
+
+class ConversionJob:
+    __slots__ = ("user_id", "update", "run", "editor", "cancel_event", "task", "enqueued_at", "pages")
+
+    def __init__(self, update: Update, run, status):
+        self.user_id = update.message.from_user.id
+        self.update = update
+        self.run = run
+        self.editor = StreamingEditor(status, cursor="")
+        self.cancel_event = threading.Event()
+        self.task = None
+        self.enqueued_at = time.monotonic()
+        self.pages = 0
+
+class ConversionQueue:
+    """PDF konvertatsiyalari uchun fon navbati.
+
+    Bir vaqtda `workers` tagacha ish bajariladi, navbat `max_queue` bilan
+    cheklangan. Har foydalanuvchida bittadan ortiq ish bo'lmaydi, shuning uchun
+    FIFO navbat foydalanuvchilar o'rtasida adolatli.
+    """
+
+    def __init__(self, workers: int = CONVERT_WORKERS, max_queue: int = CONVERT_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue = deque()
+        self._jobs = {}  # user_id -> navbatdagi yoki ishlayotgan ish
+        self._cond = asyncio.Condition()
+        self._tasks = []
+        self._notices = set()
+        self.running = 0
+        self.peak_queue = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    async def submit(self, update: Update, run):
+        """Ishni navbatga qo'yish va holat xabarini yuborish"""
+        user_id = update.message.from_user.id
+        if user_id in self._jobs:
+            await update.message.reply_text("⏳ Oldingi ishingiz hali tugamagan. Bekor qilish uchun '🔙 Back'.")
+            return
+        wait = convert_limiter.check(user_id)
+        if wait:
+            await reply_rate_limited(update, convert_limiter, wait,
+                                     "⏳ PDF yaratish limiti. {seconds} soniyadan keyin qayta urinib ko'ring.")
+            return
+        if len(self._queue) >= self.max_queue:
+            self.rejected += 1
+            await update.message.reply_text("⚠️ Hozir navbat to'la, birozdan keyin urinib ko'ring.")
+            return
+        
+        self._jobs[user_id] = None  # holat xabari yuborilguncha joy band
+        position = len(self._queue) + 1 if self.running + len(self._queue) >= self.workers else 0
+        try:
+            status = await update.message.reply_text(
+                f"⏳ Navbatda: {position}-o'rin" if position else "⏳ PDF yaratilmoqda..."
+            )
+        except Exception:
+            self._jobs.pop(user_id, None)
+            raise
+        if user_id not in self._jobs:
+            return  # shu orada bekor qilindi
+        
+        job = self._jobs[user_id] = ConversionJob(update, run, status)
+        async with self._cond:
+            self._queue.append(job)
+            self.submitted += 1
+            self.peak_queue = max(self.peak_queue, len(self._queue))
+            self._cond.notify()
+
+    def cancel(self, user_id: int) -> bool:
+        """Navbatdagi ishni olib tashlash yoki ishlayotganini to'xtatish"""
+        if user_id not in self._jobs:
+            return False
+        job = self._jobs.pop(user_id)
+        if job is None:
+            return True
+        
+        job.cancel_event.set()
+        if job.task is not None:
+            job.task.cancel()
+        elif job in self._queue:
+            self._queue.remove(job)
+            self.cancelled += 1
+            self._notify(job, "❌ Bekor qilindi.")
+            self._announce_positions()
+        return True
+
+    def _notify(self, job: ConversionJob, text: str):
+        task = asyncio.create_task(job.editor.finish(text))
+        self._notices.add(task)
+        task.add_done_callback(self._notices.discard)
+
+    def _announce_positions(self):
+        for position, job in enumerate(self._queue, 1):
+            task = asyncio.create_task(job.editor.update(f"⏳ Navbatda: {position}-o'rin"))
+            self._notices.add(task)
+            task.add_done_callback(self._notices.discard)
+
+    async def _worker(self):
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: self._queue)
+                job = self._queue.popleft()
+            self._announce_positions()
+            
+            waited = time.monotonic() - job.enqueued_at
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            
+            self.running += 1
+            started_at = time.monotonic()
+            stopping = False
+            try:
+                await job.editor.finish("⏳ PDF yaratilmoqda...")
+                if job.cancel_event.is_set():
+                    # Holat xabari yuborilayotganda bekor qilindi
+                    self.cancelled += 1
+                    self._notify(job, "❌ Bekor qilindi.")
+                    continue
+                job.task = asyncio.create_task(job.run(job.update, job))
+                await asyncio.wait({job.task})
+                
+                elapsed = time.monotonic() - started_at
+                if job.task.cancelled():
+                    self.cancelled += 1
+                    self._notify(job, "❌ Bekor qilindi.")
+                    continue
+                if job.task.exception() is not None:
+                    self.failed += 1
+                    logger.error("Konvertatsiya xatolik: %s", job.task.exception())
+                else:
+                    self.completed += 1
+                    self.run_total += elapsed
+                    self.run_max = max(self.run_max, elapsed)
+            except asyncio.CancelledError:
+                stopping = True
+                if job.task is not None:
+                    job.task.cancel()
+                raise
+            except Exception as e:
+                # Masalan holat xabarini tahrirlashda tarmoq xatoligi: worker to'xtamasligi kerak
+                self.failed += 1
+                logger.error("Konvertatsiya xatolik: %s", e)
+            finally:
+                self.running -= 1
+                if self._jobs.get(job.user_id) is job:
+                    del self._jobs[job.user_id]
+                    # Bot to'xtayotganda fayllar qoladi (qayta ishga tushgach kerak bo'ladi)
+                    if not stopping:
+                        cleanup_user_data(job.user_id)
+
+    def start(self):
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> dict:
+        """Navbat chuqurligi va ish davomiyligi metrikalari"""
+        started = self.submitted - len(self._queue)
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "peak_queue": self.peak_queue,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_total / started * 1000, 2) if started else 0.0,
+            "max_wait_ms": round(self.wait_max * 1000, 2),
+            "avg_run_ms": round(self.run_total / self.completed * 1000, 2) if self.completed else 0.0,
+            "max_run_ms": round(self.run_max * 1000, 2),
+        }
+
+conversion_queue = ConversionQueue()
 
 # 🚀 Webhook'ni asinxron sozlash
 async def setup_webhook():
@@ -553,70 +3264,503 @@ async def setup_webhook():
         await telegram_app.bot.set_webhook(
             url=webhook_path,
             drop_pending_updates=True,
-            allowed_updates=["message", "callback_query"]
+            allowed_updates=list(HANDLED_UPDATE_TYPES),
+            secret_token=WEBHOOK_SECRET,
         )
         
-        logger.info(f"✅ Webhook o'rnatildi: {webhook_path}")
+        logger.info("✅ Webhook o'rnatildi: %s", webhook_path)
         
         # Webhook statusini tekshirish
         webhook_info = await telegram_app.bot.get_webhook_info()
-        logger.info(f"📡 Webhook URL: {webhook_info.url}")
-        logger.info(f"📊 Pending updates: {webhook_info.pending_update_count}")
+        logger.info("📡 Webhook URL: %s", webhook_info.url)
+        logger.info("📊 Pending updates: %d", webhook_info.pending_update_count)
         
         if webhook_info.last_error_message:
-            logger.error(f"⚠️ Webhook xatolik: {webhook_info.last_error_message}")
+            logger.error("⚠️ Webhook xatolik: %s", webhook_info.last_error_message)
         
     except Exception as e:
-        logger.error(f"❌ Webhook sozlashda xatolik: {e}")
+        logger.error("❌ Webhook sozlashda xatolik: %s", e)
 
-# 🚀 Flask'ni alohida threadda ishga tushirish
-def run_flask():
-    """Flask'ni alohida threadda ishga tushirish"""
-    app.run(host="0.0.0.0", port=PORT, debug=False, use_reloader=False)
+# 🔁 Fon vazifalari
+background_tasks = set()
 
-# 🔄 Async event loop'ni alohida threadda ishga tushirish
-def run_async_loop(loop):
-    """Async event loop'ni ishga tushirish"""
-    asyncio.set_event_loop(loop)
-    loop.run_forever()
+async def on_startup(application: Application):
+    """Fon vazifalarini ishga tushirish"""
+    background_tasks.add(asyncio.create_task(sweep_sessions()))
+    background_tasks.add(asyncio.create_task(reaper.run()))
+    if CONVERT_WARMUP:
+        background_tasks.add(asyncio.create_task(warm_up_conversions()))
+    conversion_queue.start()
+
+# 🛑 To'xtatishda resurslarni yopish
+async def on_shutdown(application: Application):
+    """Fon vazifalari, HTTP connection pool va sessiya omborini yopish"""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await conversion_queue.stop()
+    await groq_client.aclose()
+    sessions.close()
+    if image_executor is not None:
+        image_executor.shutdown(wait=False, cancel_futures=True)
+
+# 🌐 Webhook serverini bot bilan bitta event loop'da ishga tushirish
+async def run_webhook():
+    """aiohttp server + update processor + Telegram app"""
+    await setup_webhook()
+    await on_startup(telegram_app)
+    
+    dispatcher.start()
+    
+    runner = web.AppRunner(create_web_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host="0.0.0.0", port=PORT)
+    await site.start()
+    logger.info("🚀 Webhook serveri ishga tushdi")
+    
+    try:
+        await wait_for_stop_signal()
+    finally:
+        logger.info("🛑 Bot to'xtatilmoqda...")
+        await runner.cleanup()
+        await dispatcher.stop()
+        await telegram_app.stop()
+        await telegram_app.shutdown()
+        await on_shutdown(telegram_app)
+
+# 🧩 Ko'p jarayonli rejim: ingress + N ta worker (WORKER_PROCESSES > 1)
+class HashRing:
+    """Consistent hashing: foydalanuvchi -> worker.
+
+    Har bir foydalanuvchi doim bitta workerga tushadi (sessiya holati va
+    data/{user_id}/ o'sha jarayonda qoladi). Workerlar soni o'zgarsa
+    foydalanuvchilarning faqat ~1/N qismi boshqa workerga ko'chadi.
+    """
+
+    def __init__(self, nodes: int, replicas: int = 160):
+        points = sorted(
+            (self._hash(f"worker-{node}:{replica}"), node)
+            for node in range(nodes) for replica in range(replicas)
+        )
+        self._points = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def node(self, key) -> int:
+        index = bisect_left(self._points, self._hash(str(key)))
+        return self._nodes[index % len(self._nodes)]
+
+def bus_path(index: int) -> str:
+    return os.path.join(BUS_DIR, f"worker-{index}.sock")
+
+def stats_path(index: int) -> str:
+    """Worker'ning /health va /metrics HTTP socketi (faqat ingress o'qiydi)"""
+    return os.path.join(BUS_DIR, f"worker-{index}.http.sock")
+
+def merge_metrics(sources: list) -> str:
+    """[(worker, exposition matni), ...] -> bitta matn.
+
+    Har bir metrika oilasi bitta guruhda qoladi (HELP/TYPE bir marta), har
+    bir seriyaga esa qaysi jarayondan kelgani `worker` label'i bilan qo'shiladi.
+    """
+    families = {}  # nom -> (sarlavha qatorlari, seriyalar)
+    for worker, text in sources:
+        label = format_labels(("worker",), (worker,))
+        parsed = []  # (oila nomi, sarlavhami, qator)
+        name = None
+        try:
+            for line in text.splitlines():
+                if not line:
+                    continue
+                if line.startswith("# "):
+                    name = line.split(" ", 3)[2]
+                    parsed.append((name, True, line))
+                    continue
+                if name is None:
+                    raise ValueError(f"sarlavhasiz qator: {line[:80]}")
+                name_end = min(index for index in (line.find("{"), line.find(" ")) if index != -1)
+                if line[name_end] == "{":
+                    parsed.append((name, False, f"{line[:name_end]}{label[:-1]},{line[name_end + 1:]}"))
+                else:
+                    parsed.append((name, False, f"{line[:name_end]}{label}{line[name_end:]}"))
+        except (ValueError, IndexError) as e:
+            # Buzuq javob (masalan, worker to'xtayotganda) butunlay tashlanadi
+            logger.warning("Worker %s metrikalari o'qilmadi: %s", worker, e)
+            continue
+        for name, header, line in parsed:
+            family = families.setdefault(name, ([], []))
+            if not header:
+                family[1].append(line)
+            elif len(family[0]) < 2:
+                family[0].append(line)
+    lines = []
+    for headers, samples in families.values():
+        lines.extend(headers)
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+class WorkerLink:
+    """Ingress -> worker ulanishi: bir qatorda bitta update JSON'i.
+
+    Worker har bir qatorga tartib bilan "1" (qabul qilindi) yoki "0"
+    (backlog to'lgan) deb javob beradi, shuning uchun so'rovlar kutmasdan
+    ketma-ket yuboriladi va javoblar FIFO bo'yicha moslanadi.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.path = bus_path(index)
+        self.process = None
+        self._writer = None
+        self._reader_task = None
+        self._pending = deque()
+        self.forwarded = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None
+
+    async def connect(self, timeout: float = 60):
+        """Worker socketi paydo bo'lguncha ulanishga urinish"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline or self.process.returncode is not None:
+                    raise
+                await asyncio.sleep(0.1)
+        self._reader_task = asyncio.create_task(self._read(reader))
+
+    async def _read(self, reader: asyncio.StreamReader):
+        try:
+            while line := await reader.readline():
+                future = self._pending.popleft()
+                if not future.done():
+                    future.set_result(line == b"1\n")
+        finally:
+            self._writer = None
+            while self._pending:
+                future = self._pending.popleft()
+                if not future.done():
+                    future.set_result(False)
+
+    async def send(self, body: bytes) -> bool:
+        """Update'ni workerga berish; worker band yoki ishlamayotgan bo'lsa False"""
+        if self._writer is None:
+            self.rejected += 1
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(future)
+        try:
+            self._writer.write(body + b"\n")
+            await self._writer.drain()
+        except ConnectionError:
+            self.rejected += 1
+            return False
+        accepted = await future
+        if accepted:
+            self.forwarded += 1
+        else:
+            self.rejected += 1
+        return accepted
+
+    async def fetch(self, path: str, timeout: float = 5):
+        """Worker'ning /health yoki /metrics javobi (matn); javob bermasa None"""
+        if not self.connected:
+            return None
+        try:
+            async with aiohttp.ClientSession(
+                connector=aiohttp.UnixConnector(path=stats_path(self.index)),
+                timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as http:
+                async with http.get(f"http://worker{path}") as response:
+                    response.raise_for_status()
+                    return await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as e:
+            logger.warning("Worker %d %s javob bermadi: %s", self.index, path, e)
+            return None
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+            self._reader_task = None
+
+class WorkerPool:
+    """Worker jarayonlarini ishga tushirish, kuzatish va update'larni yo'naltirish"""
+
+    def __init__(self, count: int = WORKER_PROCESSES):
+        self.ring = HashRing(count)
+        self.links = [WorkerLink(index) for index in range(count)]
+        self._tasks = []
+        self._stopping = False
+
+    def worker_env(self, index: int) -> dict:
+        """Har bir workerga o'z indeksi, blob papkasi va rasm pool ulushi"""
+        env = dict(os.environ, WORKER_INDEX=str(index), BLOB_DIR=os.path.join(BLOB_DIR, f"w{index}"))
+        env.setdefault("IMAGE_WORKERS", str(max(1, IMAGE_WORKERS // len(self.links))))
+        return env
+
+    async def _supervise(self, link: WorkerLink):
+        """Worker to'xtab qolsa qayta ishga tushirish"""
+        while not self._stopping:
+            link.process = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__), env=self.worker_env(link.index)
+            )
+            try:
+                await link.connect()
+                logger.info("🧩 Worker %d ulandi (pid %d)", link.index, link.process.pid)
+            except OSError as e:
+                logger.error("❌ Worker %d ga ulanib bo'lmadi: %s", link.index, e)
+            code = await link.process.wait()
+            await link.close()
+            if self._stopping:
+                return
+            link.restarts += 1
+            logger.error("💥 Worker %d to'xtadi (kod %s), qayta ishga tushirilmoqda", link.index, code)
+            await asyncio.sleep(1)
+
+    async def start(self):
+        os.makedirs(BUS_DIR, exist_ok=True)
+        for link in self.links:
+            self._tasks.append(asyncio.create_task(self._supervise(link)))
+
+    def route(self, json_data: dict) -> WorkerLink:
+        return self.links[self.ring.node(update_user_key(json_data))]
+
+    async def stop(self, timeout: float = 15):
+        self._stopping = True
+        for link in self.links:
+            await link.close()
+        processes = [link.process for link in self.links if link.process and link.process.returncode is None]
+        for process in processes:
+            process.terminate()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(process.wait() for process in processes)), timeout)
+        except asyncio.TimeoutError:
+            for process in processes:
+                if process.returncode is None:
+                    process.kill()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> list:
+        return [
+            {
+                "index": link.index,
+                "pid": link.process.pid if link.process else None,
+                "connected": link.connected,
+                "forwarded": link.forwarded,
+                "rejected": link.rejected,
+                "in_flight": len(link._pending),
+                "restarts": link.restarts,
+            }
+            for link in self.links
+        ]
+
+worker_pool = WorkerPool() if WORKER_PROCESSES > 1 and WORKER_INDEX is None else None
+
+async def forward_webhook(request: web.Request) -> web.Response:
+    """Ingress: update'ni foydalanuvchining workeriga uzatish"""
+    try:
+        if not update_filter.authorized(request):
+            return web.Response(text="Forbidden", status=403)
+        body = await request.read()
+        json_data = update_filter.inspect(body)
+        if json_data is None:
+            return web.Response(text="OK")
+        link = worker_pool.route(json_data)
+        if b"\n" in body:
+            body = json.dumps(json_data).encode()
+        if not await link.send(body):
+            # Worker band yoki qayta ishga tushmoqda: Telegram keyinroq qayta yuboradi
+            logger.warning("🚦 Worker %d update'ni qabul qilmadi", link.index)
+            return web.Response(text="Busy", status=503)
+        update_filter.accept(json_data)
+        return web.Response(text="OK")
+    except Exception as e:
+        logger.error("Webhook xatolik: %s", e)
+        return web.Response(text="Error", status=500)
+
+async def ingress_health(request: web.Request) -> web.Response:
+    """Barcha workerlar ulangunicha 503 (load balancer trafik yubormasin)"""
+    ready = all(link.connected for link in worker_pool.links)
+    workers = worker_pool.stats()
+    replies = await asyncio.gather(*(link.fetch("/health") for link in worker_pool.links))
+    healthy = ready
+    for stats, reply in zip(workers, replies):
+        # Workerning o'z /health'i: dispatcher, navbat, kesh, disk va h.k.
+        try:
+            stats["health"] = json.loads(reply) if reply is not None else None
+        except ValueError:
+            stats["health"] = None
+        if stats["health"] is None:
+            healthy = False
+    # HTTP kodi faqat ulanishga bog'liq: bitta workerning buzuq javobi ingress'ni LB'dan chiqarmasin
+    return web.json_response({
+        "status": "healthy" if healthy else "degraded",
+        "bot": "ingress",
+        "ingress": update_filter.stats(),
+        "workers": workers,
+    }, status=200 if ready else 503)
+
+async def ingress_metrics(request: web.Request) -> web.Response:
+    """Ingress va barcha workerlar metrikalari, `worker` label'i bilan"""
+    replies = await asyncio.gather(*(link.fetch("/metrics") for link in worker_pool.links))
+    sources = [("ingress", metrics.render())]
+    sources += [(str(link.index), reply) for link, reply in zip(worker_pool.links, replies) if reply is not None]
+    return web.Response(text=merge_metrics(sources), content_type="text/plain", charset="utf-8",
+                        headers={"X-Prometheus-Format": "0.0.4"})
+
+async def serve_stats(index: int) -> web.AppRunner:
+    """Worker: /health va /metrics ni ingress uchun Unix socketda ochish"""
+    app = web.Application()
+    app.router.add_get('/health', health)
+    app.router.add_get('/metrics', metrics_endpoint)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    path = stats_path(index)
+    if os.path.exists(path):
+        os.unlink(path)
+    await web.UnixSite(runner, path).start()
+    return runner
+
+async def serve_bus(index: int):
+    """Worker: ingress'dan kelgan update'larni dispatcher'ga berish"""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                try:
+                    accepted = dispatcher.submit(json.loads(line))
+                except ValueError as e:
+                    logger.error("Bus xatolik: %s", e)
+                    accepted = True  # buzuq update qayta yuborilmasin
+                writer.write(b"1\n" if accepted else b"0\n")
+        except (ConnectionError, asyncio.CancelledError):
+            pass  # ingress yoki worker to'xtamoqda
+        finally:
+            writer.close()
+
+    path = bus_path(index)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)
+    return await asyncio.start_unix_server(handle, path=path, limit=16 * 1024 * 1024)
+
+async def wait_for_stop_signal():
+    """SIGTERM/SIGINT kelguncha kutish"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    await stop_event.wait()
+
+async def run_ingress():
+    """Webhook qabul qiluvchi jarayon: setWebhook, workerlar va aiohttp server"""
+    await setup_webhook()
+    await worker_pool.start()
+    
+    runner = web.AppRunner(create_web_app(forward_webhook, ingress_health, ingress_metrics))
+    await runner.setup()
+    site = web.TCPSite(runner, host="0.0.0.0", port=PORT)
+    await site.start()
+    logger.info("🚀 Ingress ishga tushdi: %d ta worker", len(worker_pool.links))
+    
+    try:
+        await wait_for_stop_signal()
+    finally:
+        logger.info("🛑 Bot to'xtatilmoqda...")
+        await runner.cleanup()
+        await worker_pool.stop()
+        await telegram_app.stop()
+        await telegram_app.shutdown()
+
+async def run_worker():
+    """Worker jarayon: bus'dan update'lar, o'z sessiyalari va konvertatsiya navbati"""
+    index = int(WORKER_INDEX)
+    await telegram_app.initialize()
+    await telegram_app.start()
+    await on_startup(telegram_app)
+    dispatcher.start()
+    stats_runner = await serve_stats(index)
+    server = await serve_bus(index)
+    logger.info("🧩 Worker %d tayyor", index)
+    
+    try:
+        await wait_for_stop_signal()
+    finally:
+        server.close()
+        await server.wait_closed()
+        await stats_runner.cleanup()
+        await dispatcher.stop()
+        await telegram_app.stop()
+        await telegram_app.shutdown()
+        await on_shutdown(telegram_app)
 
 # 🚀 Botni ishga tushirish
 def main():
     global telegram_app
     
-    telegram_app = Application.builder().token(BOT_TOKEN).build()
+    telegram_app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(f"{TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
     # Handlerlar
-    telegram_app.add_handler(CommandHandler("start", start))
-    telegram_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
-    telegram_app.add_handler(MessageHandler(filters.PHOTO, handle_image))
-    telegram_app.add_handler(MessageHandler(filters.Document.ALL, handle_word))
+    telegram_app.add_handler(CommandHandler("start", instrumented(start)))
+    telegram_app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, instrumented(handle_text)))
+    telegram_app.add_handler(MessageHandler(filters.PHOTO, instrumented(handle_image)))
+    telegram_app.add_handler(MessageHandler(filters.Document.ALL, instrumented(handle_word)))
+
+    # Unicode shrift bo'lmasa Word → PDF krillni yo'qotadi: faqat shu bo'lim o'chadi,
+    # chat va Image → PDF ishlashda davom etadi (parse birinchi konvertatsiyada yoki warm-up'da)
+    if not font_cache.available():
+        logger.error(
+            "❌ Unicode shrift topilmadi: %s — Word → PDF o'chirildi. DejaVu shriftlarini o'rnating "
+            "(masalan apt install fonts-dejavu-core) va FONT_DIR ni ko'rsating",
+            FONT_FILES[''],
+        )
+
+    if WORKER_INDEX is not None:
+        # Ingress ishga tushirgan worker jarayon
+        asyncio.run(run_worker())
+        return
 
     logger.info("🤖 Bot ishga tushdi...")
     logger.info("💬 Chatbot: Groq Llama 3.3 70B")
     logger.info("📄 Word → PDF: Krill + Rasmlar")
+    logger.info("🔑 Groq API key yuklandi (%d belgi)", len(GROQ_API_KEY))
     
-    if WEBHOOK_URL:
-        # Webhook rejimi (Render.com)
-        logger.info(f"🌐 Webhook: {WEBHOOK_URL}")
-        logger.info(f"📡 Port: {PORT}")
-        
-        # Yangi event loop yaratish
-        loop = asyncio.new_event_loop()
+    if WEBHOOK_URL and worker_pool is not None:
+        logger.info("🌐 Webhook: %s", WEBHOOK_URL)
+        logger.info("🧩 Ko'p jarayonli rejim: %d ta worker", WORKER_PROCESSES)
+        asyncio.run(run_ingress())
         
-        # Async loop'ni alohida threadda ishga tushirish
-        async_thread = threading.Thread(target=run_async_loop, args=(loop,), daemon=True)
-        async_thread.start()
-        
-        # Webhook'ni sozlash
-        asyncio.run_coroutine_threadsafe(setup_webhook(), loop)
-        
-        # Update processor'ni ishga tushirish
-        asyncio.run_coroutine_threadsafe(process_updates(), loop)
+    elif WEBHOOK_URL:
+        # Webhook rejimi (Render.com)
+        logger.info("🌐 Webhook: %s", WEBHOOK_URL)
+        logger.info("📡 Port: %s", PORT)
+        logger.info("🚦 Workerlar: %d, backlog: %d", UPDATE_WORKERS, UPDATE_BACKLOG)
         
-        # Flask'ni asosiy threadda ishga tushirish
-        logger.info("🚀 Flask serveri ishga tushmoqda...")
-        run_flask()
+        # aiohttp server va bot bitta event loop'da
+        asyncio.run(run_webhook())
         
     else:
         # Polling rejimi (local)